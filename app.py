@@ -2,7 +2,8 @@ import os
 import sys
 import subprocess
 from PyQt5 import QtWidgets, QtCore
-from database import init_db, verify_user
+import metrics, profiler
+from database import init_db, verify_user, close_connections
 from ui_main import MainMenu
 
 # --- Environment setup ---
@@ -131,7 +132,14 @@ class Login(QtWidgets.QDialog):
 
 def main():
     init_db()
+    metrics.start_exporters()
+    profiler.install_signal_handler()
     app = QtWidgets.QApplication(sys.argv)
+    # Python only runs signal handlers between bytecodes; while Qt sits in
+    # its C++ event loop this timer gives it a chance twice a second
+    signal_timer = QtCore.QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
 
     AUTO_USERNAME = "eryyyj"
     AUTO_PASSWORD = "123456789"
@@ -157,6 +165,7 @@ def main():
             if not getattr(main_window, "logout_requested", False):
                 break
 
+    close_connections()
     sys.exit()
 
 
@@ -1,7 +1,12 @@
-import cv2, os
+import cv2, os, threading, time
+from collections import deque, namedtuple
+
+# One captured frame, stamped with time.monotonic() and a 1-based sequence number
+CapturedFrame = namedtuple("CapturedFrame", ["image", "timestamp", "seq"])
+
 
 class Camera:
-    def __init__(self):
+    def __init__(self, threaded=False, buffer_size=1, width=640, height=480):
         # Prefer the virtual camera created by rpicam-vid
 
         if os.path.exists("/dev/video10"):
@@ -9,14 +14,114 @@ class Camera:
         else:
             self.cap = cv2.VideoCapture(0)
 
-        # Configure resolution (optional, some bridges ignore this)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        # Configure resolution (optional, some bridges ignore this).
+        # Raise it together with ShrimpDetector(tiled=True) for small shrimp.
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        # --- Threaded capture state ---
+        # The background thread keeps the newest `buffer_size` frames;
+        # buffer_size=1 is a latest-only buffer.
+        self.threaded = threaded
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._seq = 0               # last sequence number captured
+        self._delivered_seq = 0     # last sequence number handed to a consumer
+        self.dropped_frames = 0     # captured frames no consumer ever saw
+
+        if threaded:
+            self.start()
+
+    # ---------------------------------------------------------------
+    # Background capture
+    # ---------------------------------------------------------------
+    def start(self):
+        """Start reading frames continuously on a background thread."""
+        if self._running:
+            return
+        # Keep the driver queue short so we never read stale frames
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.threaded = True
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="CameraCapture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background capture thread."""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            timestamp = time.monotonic()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self._cond:
+                self._seq += 1
+                self._buffer.append(CapturedFrame(frame, timestamp, self._seq))
+                self._cond.notify_all()
+
+    def _deliver(self, captured):
+        """Book-keep a frame handed to a consumer (caller holds the lock)."""
+        if captured.seq > self._delivered_seq:
+            self.dropped_frames += captured.seq - self._delivered_seq - 1
+            self._delivered_seq = captured.seq
+        return captured
+
+    def get_latest(self, wait=False, timeout=None):
+        """
+        Return the newest CapturedFrame without blocking.
+
+        With wait=True, block (up to `timeout` seconds) until a frame newer
+        than the last one delivered arrives. Returns None if no frame is
+        available.
+        """
+        with self._cond:
+            if wait:
+                self._cond.wait_for(
+                    lambda: not self._running or self._seq > self._delivered_seq,
+                    timeout,
+                )
+            if not self._buffer:
+                return None
+            return self._deliver(self._buffer[-1])
+
+    def peek_latest(self):
+        """
+        Newest CapturedFrame without marking it delivered, so a display can
+        follow the camera without stealing frames from the detector.
+        """
+        with self._cond:
+            return self._buffer[-1] if self._buffer else None
+
+    def drain(self):
+        """Return every buffered frame not yet delivered, oldest first."""
+        with self._cond:
+            frames = [f for f in self._buffer if f.seq > self._delivered_seq]
+            for f in frames:
+                self._deliver(f)
+            return frames
 
     def get_frame(self):
+        if self.threaded:
+            captured = self.get_latest()
+            if captured is None:
+                # First frame not captured yet, give the thread a moment
+                captured = self.get_latest(wait=True, timeout=1.0)
+            return captured.image if captured is not None else None
+
         ret, frame = self.cap.read()
         return frame if ret else None
 
     def release(self):
+        self.stop()
         if self.cap.isOpened():
             self.cap.release()
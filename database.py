@@ -1,6 +1,10 @@
-import sqlite3, os, datetime, bcrypt, uuid
+import sqlite3, os, datetime, bcrypt, uuid, threading
+from collections import namedtuple
+from contextlib import contextmanager
 from pymongo import MongoClient
 
+import metrics
+
 
 # ------------------------
 # Configuration
@@ -16,12 +20,134 @@ if os.path.exists("config/config.env"):
             MONGO_URI = line.split("=", 1)[1].strip()
 
 
+# ------------------------
+# Connection Management
+# ------------------------
+# Applied to every connection. WAL lets readers run alongside the writer
+# and turns each commit into an append to the log (no fsync with
+# synchronous=NORMAL; the log is synced at checkpoints instead).
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",      # 8 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+STATEMENT_CACHE_SIZE = 64   # compiled statements kept per connection
+
+
+class ConnectionManager:
+    """
+    Long-lived connections to one SQLite file.
+
+    Each thread gets its own reader connection (reader()); all writes go
+    through one shared writer connection behind a lock (writer()), so the
+    detector, the sync worker and the GUI never fight over the write lock
+    and readers are never blocked by it. Connections stay open, so the
+    sqlite3 statement cache reuses compiled queries across calls.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._readers = {}          # thread ident -> connection
+        self._readers_lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def reader(self):
+        """This thread's read connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                # Forget connections of threads that have exited
+                alive = {t.ident for t in threading.enumerate()}
+                for ident in [i for i in self._readers if i not in alive]:
+                    self._readers.pop(ident).close()
+                self._readers[threading.get_ident()] = conn
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """The shared write connection, held exclusively; commits on success, rolls back on error."""
+        with self._write_lock, metrics.timed("sqlite_write"):
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers.values():
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def connections():
+    """ConnectionManager for the current DB_PATH (re-resolved so DB_PATH can be repointed)."""
+    manager = _managers.get(DB_PATH)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.setdefault(DB_PATH, ConnectionManager(DB_PATH))
+    return manager
+
+
+def close_connections():
+    """Close every pooled connection (app exit, or before moving the DB file)."""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
+
+
 # ------------------------
 # Database Initialization
 # ------------------------
 def init_db():
-    """Initialize local SQLite database tables."""
-    conn = sqlite3.connect(DB_PATH)
+    """Bring local.db up to the current schema and seed the offline admin."""
+    with connections().writer() as conn:
+        migrate(conn)
+
+        # Create default offline admin if no user exists
+        cur = conn.execute("SELECT COUNT(*) FROM users")
+        if cur.fetchone()[0] == 0:
+            hashed_pw = bcrypt.hashpw("admin".encode(), bcrypt.gensalt()).decode()
+            conn.execute(
+                "INSERT INTO users(id, username, email, password) VALUES(?,?,?,?)",
+                ("local-admin", "admin", "admin@example.com", hashed_pw)
+            )
+
+
+# ------------------------
+# Schema Migrations
+# ------------------------
+# PRAGMA user_version holds the number of migrations applied. Each one
+# runs in its own transaction together with the version bump, so a unit
+# that loses power mid-upgrade resumes from the last complete step.
+# Append new steps; never edit or reorder shipped ones.
+def _migration_base_tables(conn):
+    """Tables as shipped before versioning (no-op on existing databases)."""
     conn.execute("""
     CREATE TABLE IF NOT EXISTS users(
         id TEXT PRIMARY KEY,
@@ -42,18 +168,66 @@ def init_db():
         synced INTEGER DEFAULT 0
     )
     """)
-    conn.commit()
-
-    # Create default offline admin if no user exists
-    cur = conn.execute("SELECT COUNT(*) FROM users")
-    if cur.fetchone()[0] == 0:
-        hashed_pw = bcrypt.hashpw("admin".encode(), bcrypt.gensalt()).decode()
-        conn.execute(
-            "INSERT INTO users(id, username, email, password) VALUES(?,?,?,?)",
-            ("local-admin", "admin", "admin@example.com", hashed_pw)
-        )
+
+
+def _migration_owner_indexes(conn):
+    """Indexes for the per-owner history and the unsynced-rows query."""
+    # get_all_records / get_last_record: WHERE ownerId=? ORDER BY id DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_owner_id "
+                 "ON biomass_records(ownerId, id)")
+    # count_unsynced/push_unsynced: WHERE ownerId=? AND synced=0 [AND id>?] ORDER BY id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_owner_synced "
+                 "ON biomass_records(ownerId, synced)")
+
+
+def _migration_unique_record_id(conn):
+    """Give every record a recordId, re-key duplicates (the oldest keeps its id) and make it unique."""
+    # Duplicates are real measurements, so they get a fresh id rather than
+    # being deleted. Under the new id they are not in MongoDB yet.
+    rekey = conn.execute("""
+        SELECT id FROM biomass_records
+        WHERE recordId IS NULL OR recordId=''
+           OR id NOT IN (SELECT MIN(id) FROM biomass_records GROUP BY recordId)
+    """).fetchall()
+    conn.executemany("UPDATE biomass_records SET recordId=?, synced=0 WHERE id=?",
+                     [(str(uuid.uuid4()), row_id) for (row_id,) in rekey])
+    if rekey:
+        print(f"Migration: gave {len(rekey)} record(s) a new recordId")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_records_record_id "
+                 "ON biomass_records(recordId)")
+
+
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_owner_indexes,
+    _migration_unique_record_id,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply the migrations `conn`'s database has not seen yet; returns the new version."""
+    current = schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"{DB_PATH} has schema version {current}, newer than this "
+                           f"app ({SCHEMA_VERSION}); refusing to run on it")
+    if conn.in_transaction:
         conn.commit()
-    conn.close()
+    for version, step in enumerate(MIGRATIONS[current:], current + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"Migration {version}: {step.__doc__.splitlines()[0]}")
+    return SCHEMA_VERSION
 
 
 # ------------------------
@@ -81,10 +255,9 @@ def verify_user(username, password):
 
     # Fallback: Local login
     print("Falling back to local SQLite verification...")
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.execute("SELECT id, password FROM users WHERE username=?", (username,))
-    row = cur.fetchone()
-    conn.close()
+    row = connections().reader().execute(
+        "SELECT id, password FROM users WHERE username=?", (username,)
+    ).fetchone()
     if row and bcrypt.checkpw(password.encode(), row[1].encode()):
         print("Local user verified successfully.")
         return row[0]
@@ -94,13 +267,11 @@ def verify_user(username, password):
 
 def cache_user(uid, username, email, hashed_pw):
     """Cache verified MongoDB user locally for offline access."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-    INSERT OR IGNORE INTO users(id, username, email, password)
-    VALUES(?,?,?,?)
-    """, (uid, username, email, hashed_pw))
-    conn.commit()
-    conn.close()
+    with connections().writer() as conn:
+        conn.execute("""
+        INSERT OR IGNORE INTO users(id, username, email, password)
+        VALUES(?,?,?,?)
+        """, (uid, username, email, hashed_pw))
 
 
 # ------------------------
@@ -108,43 +279,76 @@ def cache_user(uid, username, email, hashed_pw):
 # ------------------------
 def save_biomass_record(owner_id, shrimp_count, biomass, feed_measurement):
     """Save a local record for the current user."""
-    conn = sqlite3.connect(DB_PATH)
     record_id = str(uuid.uuid4())
     date_time = datetime.datetime.now().isoformat()
-    conn.execute("""
-    INSERT INTO biomass_records(ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime, synced)
-    VALUES(?,?,?,?,?, ?,0)
-    """, (owner_id, record_id, shrimp_count, biomass, feed_measurement, date_time))
-    conn.commit()
-    conn.close()
+    with connections().writer() as conn:
+        conn.execute("""
+        INSERT INTO biomass_records(ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime, synced)
+        VALUES(?,?,?,?,?, ?,0)
+        """, (owner_id, record_id, shrimp_count, biomass, feed_measurement, date_time))
 
 
 def get_all_records(owner_id):
     """Retrieve all local records belonging to a specific user."""
-    conn = sqlite3.connect(DB_PATH)
-    rows = conn.execute(
+    return connections().reader().execute(
         "SELECT * FROM biomass_records WHERE ownerId=? ORDER BY id DESC",
         (owner_id,)
     ).fetchall()
-    conn.close()
+
+
+def get_records_page(owner_id, before_id=None, limit=50):
+    """
+    One page of a user's records, newest first. Pass the smallest id of
+    the previous page as `before_id` for the next one (keyset pagination
+    on idx_records_owner_id, so every page costs the same).
+    """
+    conn = connections().reader()
+    if before_id is None:
+        return conn.execute(
+            "SELECT * FROM biomass_records WHERE ownerId=? ORDER BY id DESC LIMIT ?",
+            (owner_id, limit)
+        ).fetchall()
+    return conn.execute(
+        "SELECT * FROM biomass_records WHERE ownerId=? AND id<? ORDER BY id DESC LIMIT ?",
+        (owner_id, before_id, limit)
+    ).fetchall()
+
+
+def get_records_newer(owner_id, after_id):
+    """A user's records with id > `after_id`, newest first."""
+    return connections().reader().execute(
+        "SELECT * FROM biomass_records WHERE ownerId=? AND id>? ORDER BY id DESC",
+        (owner_id, after_id)
+    ).fetchall()
+
+
+def get_records_by_ids(owner_id, ids):
+    """Current rows for `ids` (deleted ones are simply missing)."""
+    ids = list(ids)
+    conn = connections().reader()
+    rows = []
+    for i in range(0, len(ids), 500):     # stay under SQLite's variable limit
+        chunk = ids[i:i + 500]
+        rows += conn.execute(
+            f"SELECT * FROM biomass_records WHERE ownerId=? AND id IN ({','.join('?' * len(chunk))})",
+            (owner_id, *chunk)
+        ).fetchall()
     return rows
 
 
 def get_last_record(owner_id=None):
     """Retrieve the most recent record (optionally filtered by user)."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connections().reader()
     if owner_id:
-        row = conn.execute(
+        return conn.execute(
             "SELECT * FROM biomass_records WHERE ownerId=? ORDER BY id DESC LIMIT 1",
             (owner_id,)
         ).fetchone()
-    else:
-        row = conn.execute("SELECT * FROM biomass_records ORDER BY id DESC LIMIT 1").fetchone()
-    conn.close()
-    return row
+    return conn.execute("SELECT * FROM biomass_records ORDER BY id DESC LIMIT 1").fetchone()
 
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 
 def delete_record(record_id, owner_id):
     """
@@ -153,22 +357,19 @@ def delete_record(record_id, owner_id):
     print(f"Deleting record {record_id} for user {owner_id}...")
 
     # --- 1. Delete locally ---
-    conn = sqlite3.connect(DB_PATH)
-    record = conn.execute(
-        "SELECT recordId, synced FROM biomass_records WHERE id=? AND ownerId=?",
-        (record_id, owner_id)
-    ).fetchone()
+    with connections().writer() as conn:
+        record = conn.execute(
+            "SELECT recordId, synced FROM biomass_records WHERE id=? AND ownerId=?",
+            (record_id, owner_id)
+        ).fetchone()
+        if record:
+            conn.execute("DELETE FROM biomass_records WHERE id=? AND ownerId=?", (record_id, owner_id))
 
     if not record:
         print("No record found locally.")
-        conn.close()
         return
 
     record_uuid, synced = record
-
-    conn.execute("DELETE FROM biomass_records WHERE id=? AND ownerId=?", (record_id, owner_id))
-    conn.commit()
-    conn.close()
     print("Deleted locally.")
 
     # --- 2. If it was synced, delete it from MongoDB as well ---
@@ -197,59 +398,142 @@ def delete_record(record_id, owner_id):
         print("Record was not synced yet, skipped MongoDB deletion.")
 
 
-def sync_biomass_records(owner_id):
+SYNC_BATCH_SIZE = 100          # records per bulk_write, read as one keyset chunk
+SYNC_TIMEOUT_MS = 10000        # server selection timeout of the sync client
+
+# Outcome of one push_unsynced chunk: the local ids now marked synced, the
+# cursor for the next chunk and the per-record error messages
+SyncBatch = namedtuple("SyncBatch", ["synced_ids", "last_id", "errors"])
+
+
+def count_unsynced(owner_id):
+    return connections().reader().execute(
+        "SELECT COUNT(*) FROM biomass_records WHERE ownerId=? AND synced=0", (owner_id,)
+    ).fetchone()[0]
+
+
+def mongo_collection(timeout_ms=SYNC_TIMEOUT_MS):
+    """Open a client and return (client, biomassrecords collection)."""
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=timeout_ms)
+    return client, client[MONGO_DB_NAME]["biomassrecords"]
+
+
+def _mongo_doc(ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime):
+    try:
+        mongo_owner_id = ObjectId(str(ownerId))
+    except Exception:
+        mongo_owner_id = str(ownerId)  # fallback if invalid format
+
+    biomass = round(float(biomass), 2) if biomass is not None else 0.0
+    feedMeasurement = round(float(feedMeasurement), 2) if feedMeasurement is not None else 0.0
+    when = datetime.datetime.fromisoformat(dateTime)
+    return {
+        "ownerId": mongo_owner_id,
+        "recordId": recordId,
+        "shrimpCount": shrimpCount,
+        "biomass": biomass,
+        "feedMeasurement": feedMeasurement,
+        "dateTime": when,
+        "timestamp_str": when.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def push_unsynced(owner_id, collection, limit=SYNC_BATCH_SIZE, after_id=0):
     """
-    Sync only the current user's unsynced records to MongoDB Atlas.
-    After syncing, mark them as synced locally.
+    Upsert the owner's next `limit` unsynced records with id > `after_id`
+    into `collection`, keyed by recordId, and mark synced only those the
+    server acknowledged. Upserts make a resend after an interrupted sync
+    harmless, and a row deleted while its upsert was in flight is deleted
+    from `collection` again. Raises when nothing can be confirmed (network,
+    write concern).
     """
-    conn = sqlite3.connect(DB_PATH)
-    rows = conn.execute("""
-        SELECT ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime
+    rows = connections().reader().execute("""
+        SELECT id, ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime
         FROM biomass_records
-        WHERE synced=0 AND ownerId=?
-    """, (owner_id,)).fetchall()
-
+        WHERE ownerId=? AND synced=0 AND id>?
+        ORDER BY id
+        LIMIT ?
+    """, (owner_id, after_id, limit)).fetchall()
     if not rows:
-        conn.close()
-        print("No unsynced records found for this user.")
-        return 0
-
-    try:
-        print(f"Preparing to sync {len(rows)} record(s) for user {owner_id}...")
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=20000)
-        db = client[MONGO_DB_NAME]          
-        col = db["biomassrecords"]           
+        return SyncBatch([], after_id, [])
 
-        docs = []
-        for (ownerId, recordId, shrimpCount, biomass, feedMeasurement, dateTime) in rows:
+    # A malformed row (bad dateTime, non-numeric biomass) is reported and
+    # skipped; it must not hold back the rest of the chunk
+    ops, sent, errors = [], [], []
+    for row in rows:
+        try:
+            doc = _mongo_doc(*row[1:])
+        except (TypeError, ValueError) as e:
+            errors.append(f"{row[2]}: {e}")
+            continue
+        record_id = doc.pop("recordId")
+        ops.append(UpdateOne({"recordId": record_id}, {"$set": doc}, upsert=True))
+        sent.append(row)
+
+    failed = set()
+    if ops:
+        try:
+            collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            details = e.details or {}
+            if details.get("writeConcernErrors"):
+                raise   # the writes may not be durable; resend them later
+            for err in details.get("writeErrors", []):
+                failed.add(err["index"])
+                errors.append(f"{sent[err['index']][2]}: {err.get('errmsg', 'write error')}")
+
+    acked = [row for i, row in enumerate(sent) if i not in failed]
+    ids = []
+    if acked:
+        placeholders = ",".join("?" * len(acked))
+        with connections().writer() as conn:
+            ids = [r[0] for r in conn.execute(
+                f"SELECT id FROM biomass_records WHERE id IN ({placeholders})", [row[0] for row in acked])]
+            if ids:
+                conn.execute(f"UPDATE biomass_records SET synced=1 WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+        # Rows deleted while their upsert was in flight: delete_record saw
+        # them unsynced and left MongoDB alone, so the upsert just recreated them
+        present = set(ids)
+        orphans = [row[2] for row in acked if row[0] not in present]
+        if orphans:
             try:
-                mongo_owner_id = ObjectId(str(ownerId))  
-            except Exception:
-                mongo_owner_id = str(ownerId)  # fallback if invalid format
-
-            biomass = round(float(biomass), 2) if biomass is not None else 0.0
-            feedMeasurement = round(float(feedMeasurement), 2) if feedMeasurement is not None else 0.0
-            docs.append({
-                "ownerId": mongo_owner_id,
-                "recordId": recordId,
-                "shrimpCount": shrimpCount,
-                "biomass": biomass,
-                "feedMeasurement": feedMeasurement,
-                "dateTime": datetime.datetime.fromisoformat(dateTime),
-                "timestamp_str": datetime.datetime.fromisoformat(dateTime).strftime("%Y-%m-%d %H:%M:%S")
-            })
+                collection.delete_many({"recordId": {"$in": orphans}})
+            except Exception as e:
+                errors.append(f"{len(orphans)} deleted record(s) left in MongoDB: {e}")
+    return SyncBatch(ids, rows[-1][0], errors)
 
-        if docs:
-            result = col.insert_many(docs)
-            print(f"Inserted {len(result.inserted_ids)} documents into MongoDB Atlas.")
-            conn.execute("UPDATE biomass_records SET synced=1 WHERE ownerId=?", (owner_id,))
-            conn.commit()
 
-        n = len(docs)
+def sync_biomass_records(owner_id):
+    """
+    Sync only the current user's unsynced records to MongoDB Atlas, in
+    one pass of SYNC_BATCH_SIZE chunks. Blocks until done; the app itself
+    syncs in the background through sync_engine.SyncEngine.
+    """
+    pending = count_unsynced(owner_id)
+    if not pending:
+        print("No unsynced records found for this user.")
+        return 0
+
+    n = 0
+    client = None
+    try:
+        print(f"Preparing to sync {pending} record(s) for user {owner_id}...")
+        client, col = mongo_collection(timeout_ms=20000)
+        after_id = 0
+        while True:
+            batch = push_unsynced(owner_id, col, after_id=after_id)
+            if batch.last_id == after_id:
+                break
+            after_id = batch.last_id
+            n += len(batch.synced_ids)
+            for error in batch.errors:
+                print("Sync error:", error)
+        print(f"Upserted {n} documents into MongoDB Atlas.")
     except Exception as e:
         print("Sync error:", e)
-        n = 0
+    finally:
+        if client is not None:
+            client.close()
 
-    conn.close()
     return n
-
@@ -1,6 +1,7 @@
 import os
 import sys
 import time
+from collections import namedtuple
 import cv2
 import numpy as np
 
@@ -14,43 +15,334 @@ if os.path.exists(onnx_dll_path):
 
 import onnxruntime as ort
 
+import metrics
+from motion_gate import MotionGate
+from tracker import CentroidTracker
 
-class ShrimpDetector:
-    def __init__(self, model_path="models/YOLOshrimp.onnx", conf_thresh=0.25, imgsz=416):
-        """Initialize ONNX model session and tracking parameters."""
-        self.model_path = model_path
-        self.conf_thresh = conf_thresh
-        self.imgsz = imgsz
+# What draw() paints, in original frame pixels: boxes (N, 4) int32, track
+# points (x, y, id, counted), the counting line x (None when off-frame)
+# and the two status text lines
+Overlay = namedtuple("Overlay", ["boxes", "points", "line_x", "status", "detail"])
 
+
+# ---------------------------------------------------------------
+# ONNX Runtime session profiles
+# ---------------------------------------------------------------
+# The Pi 5 has four cores; "latency" gives them all to one inference,
+# "throughput" leaves room for the capture/track/render threads and
+# "low-power" keeps a single core busy without spin-waiting.
+SESSION_PROFILES = {
+    "latency": {
+        "intra_op_num_threads": 4,
+        "inter_op_num_threads": 1,
+        "execution_mode": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "graph_optimization_level": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        "allow_spinning": True,
+    },
+    "throughput": {
+        "intra_op_num_threads": 2,
+        "inter_op_num_threads": 2,
+        "execution_mode": ort.ExecutionMode.ORT_PARALLEL,
+        "graph_optimization_level": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        "allow_spinning": True,
+    },
+    "low-power": {
+        "intra_op_num_threads": 1,
+        "inter_op_num_threads": 1,
+        "execution_mode": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "graph_optimization_level": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "allow_spinning": False,
+    },
+}
+
+
+def optimized_model_path(model_path, profile):
+    """Where the optimized graph for `model_path` under `profile` is cached."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{profile}.opt{ext or '.onnx'}"
+
+
+def build_session_options(profile, optimized_path=None, optimize=True):
+    """
+    SessionOptions for a named profile.
+
+    With optimize=True and an `optimized_path`, ONNX Runtime writes the
+    optimized graph there. With optimize=False the graph is loaded as-is
+    (used when loading that cached, already optimized graph).
+    """
+    if profile not in SESSION_PROFILES:
+        raise ValueError(f"Unknown session profile '{profile}', "
+                         f"expected one of {sorted(SESSION_PROFILES)}")
+    cfg = SESSION_PROFILES[profile]
+
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = cfg["intra_op_num_threads"]
+    so.inter_op_num_threads = cfg["inter_op_num_threads"]
+    so.execution_mode = cfg["execution_mode"]
+    so.add_session_config_entry(
+        "session.intra_op.allow_spinning", "1" if cfg["allow_spinning"] else "0"
+    )
+    if optimize:
+        so.graph_optimization_level = cfg["graph_optimization_level"]
+        if optimized_path:
+            so.optimized_model_filepath = optimized_path
+    else:
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    return so
+
+
+def create_session(model_path, profile="latency", cache_optimized=True):
+    """
+    Create a CPU InferenceSession for `model_path` using `profile`.
+
+    The first start writes the optimized graph next to the model; later
+    starts load that file with graph optimization disabled, skipping the
+    re-optimization. The cache is rebuilt when the source model is newer.
+    Returns (session, loaded_path).
+    """
+    providers = ["CPUExecutionProvider"]
+    if not cache_optimized:
+        return ort.InferenceSession(
+            model_path, sess_options=build_session_options(profile), providers=providers
+        ), model_path
+
+    opt_path = optimized_model_path(model_path, profile)
+    if (os.path.exists(opt_path)
+            and os.path.getmtime(opt_path) >= os.path.getmtime(model_path)):
         try:
-            self.session = ort.InferenceSession(
-                model_path, providers=["CPUExecutionProvider"]
+            session = ort.InferenceSession(
+                opt_path,
+                sess_options=build_session_options(profile, optimize=False),
+                providers=providers,
             )
-            self.input_name = self.session.get_inputs()[0].name
-            self.output_names = [o.name for o in self.session.get_outputs()]
-            print(f"Loaded ONNX model: {model_path}")
+            return session, opt_path
         except Exception as e:
-            print("Failed to load ONNX model:", e)
-            self.session = None
+            print(f"Cached optimized model unusable ({e}), rebuilding.")
+
+    session = ort.InferenceSession(
+        model_path,
+        sess_options=build_session_options(profile, optimized_path=opt_path),
+        providers=providers,
+    )
+    print(f"Saved optimized model: {opt_path}")
+    return session, model_path
+
+
+def quantized_model_path(model_path):
+    """Conventional location of the INT8 model produced by quantize.py."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext or '.onnx'}"
+
+
+# ---------------------------------------------------------------
+# Box helpers
+# ---------------------------------------------------------------
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) x1, y1, x2, y2 boxes -> (N, M)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    iw = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    ih = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+    area_a = np.maximum(a[:, 2] - a[:, 0], 0) * np.maximum(a[:, 3] - a[:, 1], 0)
+    area_b = np.maximum(b[:, 2] - b[:, 0], 0) * np.maximum(b[:, 3] - b[:, 1], 0)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+# ---------------------------------------------------------------
+# Non-maximum suppression (NumPy only)
+# ---------------------------------------------------------------
+def non_max_suppression(boxes, scores, iou_thresh=0.45, max_det=300,
+                        top_k=1000, classes=None):
+    """
+    Greedy IoU suppression over (N, 4) x1, y1, x2, y2 boxes.
+
+    Only the `top_k` highest scores enter the IoU pass and at most `max_det`
+    boxes are kept, so the cost stays bounded however many candidates the
+    model emits. Pass `classes` to suppress per class, or None to run
+    class-agnostic. Returns the indices of the kept boxes, best first.
+    """
+    n = len(scores)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Top-k pre-filter: argpartition is O(N), only the survivors get sorted
+    if n > top_k:
+        order = np.argpartition(-scores, top_k - 1)[:top_k]
+        order = order[np.argsort(-scores[order], kind="stable")]
+    else:
+        order = np.argsort(-scores, kind="stable")
+
+    b = boxes[order].astype(np.float32)
+    if classes is not None:
+        # Shift each class into its own coordinate range so boxes of
+        # different classes can never overlap (the span, not the max,
+        # since boxes clipped at the border can have negative coordinates)
+        b += (classes[order].astype(np.float32) * (b.max() - b.min() + 1.0))[:, None]
+
+    x1, y1, x2, y2 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+
+    keep = []
+    remaining = np.arange(len(order))
+    while remaining.size and len(keep) < max_det:
+        i = remaining[0]
+        keep.append(i)
+        rest = remaining[1:]
+
+        iw = np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])
+        ih = np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])
+        inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        remaining = rest[iou <= iou_thresh]
+
+    return order[keep]
+
+
+class ShrimpDetector:
+    def __init__(self, model_path="models/YOLOshrimp.onnx", conf_thresh=0.25, imgsz=416,
+                 iou_thresh=0.45, max_det=300, nms_top_k=1000, agnostic_nms=False,
+                 reuse_buffers=True, profile="latency", cache_optimized=True,
+                 precision="fp32", tracker_mode="optimal", motion_prediction=True,
+                 motion_gating=False, motion_gate_params=None,
+                 roi_mode=False, roi_half_width=None, roi_margin=None,
+                 tiled=False, tile_overlap=64):
+        """
+        Initialize ONNX model session and tracking parameters.
+
+        precision="int8" loads the quantized model written by quantize.py
+        (models/YOLOshrimp.int8.onnx for the default model path).
+        model_path=None skips the model: tracking and counting only.
+        tiled=True runs high-resolution frames as overlapping imgsz tiles
+        at native resolution instead of shrinking them to imgsz.
+        """
+        if precision == "int8":
+            if model_path is None:
+                raise ValueError("precision='int8' needs a model: pass the fp32 model path "
+                                 "(its quantize.py output is loaded) or omit model_path")
+            model_path = quantized_model_path(model_path)
+        elif precision != "fp32":
+            raise ValueError(f"Unknown precision '{precision}', expected 'fp32' or 'int8'")
+        self.precision = precision
+        self.model_path = model_path
+        self.conf_thresh = conf_thresh
+        self.imgsz = imgsz
+        self.profile = profile
+
+        # Measured end-to-end detector rate (EMA over successive infer calls)
+        self.measured_fps = 0.0
+        self._last_infer_time = None
+        # Stage times (ms) of the last inference, see _record_timings()
+        self.last_timings = {}
+
+        # NMS parameters (only used for raw, non-NMS model outputs)
+        self.iou_thresh = iou_thresh
+        self.max_det = max_det
+        self.nms_top_k = nms_top_k
+        self.agnostic_nms = agnostic_nms
+
+        # Preprocessing buffers: the letterbox canvas and input tensor are
+        # allocated once and reused every frame when reuse_buffers is set
+        self.reuse_buffers = reuse_buffers
+        self._letterbox_cache = {}  # (h, w, th, tw) -> (scale, nw, nh, left, top)
+        self._buffers = {}          # (th, tw) -> (canvas, tensor, layout)
+
+        # model_path=None builds a tracking-only detector (simulations)
+        self.session = None
+        self.dynamic_input = False
+        self.dynamic_batch = False
+        if model_path is not None:
+            try:
+                self.session, loaded_path = create_session(
+                    model_path, profile=profile, cache_optimized=cache_optimized
+                )
+                self.input_name = self.session.get_inputs()[0].name
+                self.output_names = [o.name for o in self.session.get_outputs()]
+                # Symbolic (non-int) H/W dims mean the model accepts any input size
+                input_shape = self.session.get_inputs()[0].shape
+                self.dynamic_input = not all(isinstance(d, int) for d in input_shape[2:])
+                self.dynamic_batch = not isinstance(input_shape[0], int)
+                print(f"Loaded ONNX model: {loaded_path} (profile: {profile})")
+            except Exception as e:
+                print("Failed to load ONNX model:", e)
+                self.session = None
 
         # --- NEW: Parameters for Tracking and Counting ---
         self.total_count = 0
         self.count_log_file = "shrimp_count.txt"
         self.load_count() # Load previous count from file
 
-        # Define the counting line (horizontal, in the middle)
-        # We assume shrimp move from top-to-bottom
-        self.counting_line_x = int(imgsz * 0.5) 
-        
-        # Tracking parameters
-        self.active_tracks = {}  # {id: [cx, cy, frames_unseen]}
-        self.next_track_id = 0
-        self.counted_track_ids = set()
-        
-        # How far can a shrimp move (in pixels) between frames?
-        self.max_distance = int(imgsz / 8) 
-        # How many frames can we lose a shrimp before dropping the track?
-        self.max_disappeared_frames = 10 
+        # Tracking parameters (all in padded/letterboxed image space):
+        # - counting line: vertical, in the middle; shrimp move left-to-right
+        # - max_distance: how far a shrimp can move between frames
+        # - max_disappeared_frames: how long a shrimp can be lost before
+        #   its track is dropped
+        self.tracker = CentroidTracker(
+            max_distance=int(imgsz / 8),
+            max_disappeared_frames=10,
+            counting_line_x=int(imgsz * 0.5),
+            mode=tracker_mode,
+            motion_prediction=motion_prediction,
+        )
+
+        # Optional counting-band ROI (widths in original frame pixels).
+        # The half width and the extra margin each default to one frame's
+        # worth of max_distance, so a shrimp is seen at least twice before
+        # it reaches the line.
+        self.roi_mode = roi_mode
+        self.roi_half_width = roi_half_width
+        self.roi_margin = roi_margin
+        if roi_mode and self.session is not None and not self.dynamic_input:
+            print("ROI mode: model has a fixed input size, the band is "
+                  "letterboxed to full size (no speedup).")
+
+        # Optional tiled inference (overlap in original frame pixels).
+        # Boxes cut by a seam are recovered whole from the neighbouring
+        # tile as long as a shrimp fits inside the overlap.
+        self.tiled = tiled
+        self.tile_overlap = tile_overlap
+        self._tile_cache = {}       # (h, w) -> (tiles, batch tensor)
+        if tiled and self.session is not None and not self.dynamic_batch:
+            print("Tiled mode: model has a fixed batch size, tiles are run "
+                  "one session call at a time.")
+
+        # Optional motion gate: static frames reuse the last detections
+        self.motion_gate = MotionGate(**(motion_gate_params or {})) if motion_gating else None
+        self._last_inferred = None
+
+    # Tracker parameters are forwarded so callers can keep tuning them here
+    @property
+    def counting_line_x(self):
+        return self.tracker.counting_line_x
+
+    @counting_line_x.setter
+    def counting_line_x(self, value):
+        self.tracker.counting_line_x = value
+
+    @property
+    def max_distance(self):
+        return self.tracker.max_distance
+
+    @max_distance.setter
+    def max_distance(self, value):
+        self.tracker.max_distance = value
+
+    @property
+    def max_disappeared_frames(self):
+        return self.tracker.max_disappeared_frames
+
+    @max_disappeared_frames.setter
+    def max_disappeared_frames(self, value):
+        self.tracker.max_disappeared_frames = value
+
+    @property
+    def active_tracks(self):
+        """{id: (cx, cy, frames_unseen)} built from the tracker arrays."""
+        return self.tracker.as_dict()
+
+    @property
+    def counted_track_ids(self):
+        return self.tracker.counted_ids()
 
     def load_count(self):
         """Load the total count from a text file."""
@@ -76,6 +368,9 @@ class ShrimpDetector:
     # Preprocess: resize + letterbox (maintain aspect ratio)
     # ---------------------------------------------------------------
     def preprocess(self, frame):
+        if self.reuse_buffers:
+            return self._preprocess_into_buffer(frame)
+
         h, w = frame.shape[:2]
         scale = min(self.imgsz / w, self.imgsz / h)
         nw, nh = int(w * scale), int(h * scale)
@@ -96,6 +391,58 @@ class ShrimpDetector:
         img = np.expand_dims(img, axis=0).astype(np.float32)
         return img, scale, left, top
 
+    def _letterbox_params(self, h, w, target=None):
+        """
+        Return (scale, nw, nh, left, top) for letterboxing an h x w image
+        into `target` (th, tw), imgsz x imgsz by default. Cached, since the
+        camera resolution is fixed.
+        """
+        th, tw = target or (self.imgsz, self.imgsz)
+        key = (h, w, th, tw)
+        params = self._letterbox_cache.get(key)
+        if params is None:
+            scale = min(tw / w, th / h)
+            nw, nh = int(w * scale), int(h * scale)
+            params = (scale, nw, nh, (tw - nw) // 2, (th - nh) // 2)
+            self._letterbox_cache[key] = params
+        return params
+
+    def _buffers_for(self, th, tw, layout):
+        """(canvas, tensor) for a th x tw input; the border is painted once per layout."""
+        buf = self._buffers.get((th, tw))
+        if buf is None or buf[2] != layout:
+            tensor = buf[1] if buf is not None else np.empty((1, 3, th, tw), dtype=np.float32)
+            canvas = np.full((th, tw, 3), 114, dtype=np.uint8)
+            buf = self._buffers[(th, tw)] = (canvas, tensor, layout)
+        return buf[0], buf[1]
+
+    def _letterbox_into(self, img, th, tw, nw, nh, left, top):
+        """
+        Letterbox `img` into the preallocated (1, 3, th, tw) float32 tensor
+        without per-frame allocations.
+
+        The resize writes straight into the canvas interior, and the
+        BGR->RGB swap, HWC->CHW transpose and 1/255 scaling are fused into
+        a single float32 multiply. The returned tensor is overwritten by
+        the next call with the same input size.
+        """
+        canvas, tensor = self._buffers_for(th, tw, (nw, nh, left, top))
+        cv2.resize(img, (nw, nh), dst=canvas[top:top + nh, left:left + nw])
+        np.multiply(
+            canvas[:, :, ::-1].transpose(2, 0, 1),
+            np.float32(1.0 / 255.0),
+            out=tensor[0],
+            dtype=np.float32,
+        )
+        return tensor
+
+    def _preprocess_into_buffer(self, frame):
+        """Buffered preprocess(): full frame into the imgsz x imgsz tensor."""
+        h, w = frame.shape[:2]
+        scale, nw, nh, left, top = self._letterbox_params(h, w)
+        tensor = self._letterbox_into(frame, self.imgsz, self.imgsz, nw, nh, left, top)
+        return tensor, scale, left, top
+
     def save_count(self):
         """Save the current total count to a text file."""
         try:
@@ -110,9 +457,10 @@ class ShrimpDetector:
         """Resets the internal total count to 0 and saves it."""
         print("Resetting total count to 0.")
         self.total_count = 0
-        self.counted_track_ids.clear() # Clear the set of counted IDs
-        self.active_tracks.clear()     # Clear all current tracks
-        self.next_track_id = 0
+        self.tracker.reset()  # Clear all current and counted tracks
+        self._last_inferred = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
         self.save_count() # Save the reset "0" to the file
     # --- END OF NEW FUNCTION ---
 
@@ -123,216 +471,460 @@ class ShrimpDetector:
     # ---------------------------------------------------------------
     # NEW: Tracking and Counting Logic
     # ---------------------------------------------------------------
-    def _update_tracker(self, detections, scale, pad_x, pad_y):
+    def _update_tracker(self, detections, scale, pad_x, pad_y, dt=1):
         """
         Updates active tracks with new detections and counts line-crossings.
-        
-        This is a simple centroid tracker with a greedy matching algorithm.
+
+        Detections come in original frame coordinates; their centres are
+        mapped back to padded image space and handed to the CentroidTracker.
+        `dt` is the number of camera frames since the previous update, so
+        the tracker can predict across frames that were not inferred.
         """
-        current_centers = []
-        for (x1, y1, x2, y2) in detections:
-            # Map box back to padded image space for consistent tracking
-            x1_pad = (x1 * scale) + pad_x
-            y1_pad = (y1 * scale) + pad_y
-            x2_pad = (x2 * scale) + pad_x
-            y2_pad = (y2 * scale) + pad_y
-            cx = int((x1_pad + x2_pad) / 2)
-            cy = int((y1_pad + y2_pad) / 2)
-            current_centers.append((cx, cy))
-
-        if not current_centers:
-            # No detections, increment unseen frames for all active tracks
-            for tid in list(self.active_tracks.keys()):
-                self.active_tracks[tid][2] += 1
-            return
-
-        if not self.active_tracks:
-            # No active tracks, register all new detections
-            for (cx, cy) in current_centers:
-                self.active_tracks[self.next_track_id] = [cx, cy, 0]
-                self.next_track_id += 1
-            return
-
-        # Match new detections to existing tracks
-        matched_track_ids = set()
-        unmatched_center_indices = set(range(len(current_centers)))
-        
-        # Get current track positions
-        track_ids = list(self.active_tracks.keys())
-        track_positions = np.array([self.active_tracks[tid][:2] for tid in track_ids])
-        
-        # Calculate distance matrix (Tracks x Detections)
-        dist_matrix = np.linalg.norm(track_positions[:, np.newaxis] - current_centers, axis=2)
-        
-        # Greedy matching: find best match (closest) for each track
-        for i, tid in enumerate(track_ids):
-            if dist_matrix.shape[1] == 0:
-                break # No more detections to match
-                
-            min_dist_idx = np.argmin(dist_matrix[i, :])
-            min_dist = dist_matrix[i, min_dist_idx]
-            
-            if min_dist < self.max_distance:
-                # This is a match
-                new_cx, new_cy = current_centers[min_dist_idx]
-                old_cx, old_cy, _ = self.active_tracks[tid]
-                
-                # --- CHECK FOR COUNTING LINE CROSS ---
-                # Check if it crossed the line (moving downwards)
-                if (old_cx < self.counting_line_x and 
-                    new_cx >= self.counting_line_x):
-                    
-                    if tid not in self.counted_track_ids:
-                        self.total_count += 1
-                        self.counted_track_ids.add(tid)
-                        print(f"Shrimp counted! Total: {self.total_count}")
-                
-                # Update track
-                self.active_tracks[tid] = [new_cx, new_cy, 0]
-                matched_track_ids.add(tid)
-                
-                # Mark this detection as used and remove from distance matrix
-                if min_dist_idx in unmatched_center_indices:
-                    unmatched_center_indices.remove(min_dist_idx)
-                dist_matrix[:, min_dist_idx] = np.inf 
-
-        # Handle unmatched tracks (disappeared)
-        for tid in track_ids:
-            if tid not in matched_track_ids:
-                self.active_tracks[tid][2] += 1
-
-        # Register new tracks from unmatched detections
-        for idx in unmatched_center_indices:
-            cx, cy = current_centers[idx]
-            self.active_tracks[self.next_track_id] = [cx, cy, 0]
-            self.next_track_id += 1
-
-        # Clean up old, lost tracks
-        for tid in list(self.active_tracks.keys()):
-            if self.active_tracks[tid][2] > self.max_disappeared_frames:
-                # print(f"Removing track {tid}")
-                del self.active_tracks[tid]
-                self.counted_track_ids.discard(tid)
+        # Map box centres back to padded image space for consistent tracking
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+        centers = (detections[:, :2] + detections[:, 2:]) * (0.5 * scale)
+        centers += (pad_x, pad_y)
+
+        crossed = self.tracker.update(centers, dt=dt)
+        if crossed:
+            self.total_count += crossed
+            print(f"Shrimp counted! Total: {self.total_count}")
+
+    def update_tracks(self, inferred, skipped=False, dt=1):
+        """Track one infer()/gated_infer() result; skipped frames are carried into the next update."""
+        start = time.perf_counter()
+        if skipped:
+            self.tracker.skip(dt)
+        else:
+            detections, scale, pad_x, pad_y, _ = inferred
+            self._update_tracker(detections, scale, pad_x, pad_y, dt=dt)
+        metrics.observe("track", (time.perf_counter() - start) * 1000)
+
+    # ---------------------------------------------------------------
+    # Decode: vectorized confidence filter + reverse letterbox
+    # ---------------------------------------------------------------
+    def decode(self, out, scale, pad_x, pad_y, w, h, return_scores=False):
+        """
+        Decodes a raw model output into an (N, 4) float32 array of
+        (x1, y1, x2, y2) boxes in original frame coordinates.
+
+        All rows are filtered, un-letterboxed and clipped as whole arrays.
+        With return_scores=True, returns (boxes, scores).
+        """
+        empty = np.empty((0, 4), dtype=np.float32)
+        if len(out.shape) != 3:
+            return (empty, np.empty(0, dtype=np.float32)) if return_scores else empty
+        preds = out[0]
+
+        # Case 1: model already includes NMS -> (x1, y1, x2, y2, conf, cls)
+        if preds.shape[-1] in [6, 7]:
+            preds = preds[preds[:, 4] >= self.conf_thresh]
+            boxes = preds[:, :4].astype(np.float32)
+            scores = preds[:, 4].astype(np.float32)
+
+        # Case 2: raw output (no NMS) -> (cx, cy, w, h, obj, cls...)
+        elif preds.shape[-1] > 7:
+            cls_scores = preds[:, 5:]
+            cls_ids = cls_scores.argmax(axis=1)
+            conf = preds[:, 4] * cls_scores[np.arange(len(preds)), cls_ids]
+            mask = conf >= self.conf_thresh
+            preds, conf, cls_ids = preds[mask], conf[mask], cls_ids[mask]
+
+            boxes = np.empty((len(preds), 4), dtype=np.float32)
+            half_wh = preds[:, 2:4] * 0.5
+            boxes[:, :2] = preds[:, :2] - half_wh
+            boxes[:, 2:] = preds[:, :2] + half_wh
+
+            keep = non_max_suppression(
+                boxes, conf,
+                iou_thresh=self.iou_thresh,
+                max_det=self.max_det,
+                top_k=self.nms_top_k,
+                classes=None if self.agnostic_nms else cls_ids,
+            )
+            boxes = boxes[keep]
+            scores = conf[keep].astype(np.float32)
 
+        else:
+            return (empty, np.empty(0, dtype=np.float32)) if return_scores else empty
+
+        # Reverse letterbox to map boxes back to original frame, then clip
+        boxes[:, 0::2] -= pad_x
+        boxes[:, 1::2] -= pad_y
+        boxes /= scale
+        np.clip(boxes[:, 0::2], 0, w, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, h, out=boxes[:, 1::2])
+        return (boxes, scores) if return_scores else boxes
 
     # ---------------------------------------------------------------
     # Detect and visualize
     # ---------------------------------------------------------------
-    def detect(self, frame, draw=True):
-        if self.session is None:
-            return 0, frame
+    def infer(self, frame):
+        """
+        Preprocess, run the model and decode one frame.
 
+        Returns (detections, scale, pad_x, pad_y, inference_time) where
+        detections is an (N, 4) float32 array in original frame coords.
+        """
         h, w = frame.shape[:2]
+        if self.session is None:
+            scale, _, _, pad_x, pad_y = self._letterbox_params(h, w)
+            return np.empty((0, 4), dtype=np.float32), scale, pad_x, pad_y, 0.0
+
+        t0 = time.perf_counter()
+        if self.tiled:
+            return self._infer_tiled(frame, t0)
+        if self.roi_mode:
+            return self._infer_roi(frame, t0)
+
         input_tensor, scale, pad_x, pad_y = self.preprocess(frame)
 
         # ---- Run inference ----
-        start = time.time()
+        t1 = time.perf_counter()
         outputs = self.session.run(self.output_names, {self.input_name: input_tensor})
-        inference_time = (time.time() - start) * 1000
-
-        detections = [] # List of (x1, y1, x2, y2) in original frame coords
-        out = outputs[0]
-
-        # Case 1: model already includes NMS
-        if len(out.shape) == 3 and out.shape[-1] in [6, 7]:
-            for det in out[0]:
-                if det is None or len(det) < 6:
-                    continue
-                x1, y1, x2, y2, conf, cls = det[:6]
-                if conf < self.conf_thresh:
-                    continue
-
-                # Reverse letterbox to map boxes back to original frame
-                x1 = max((x1 - pad_x) / scale, 0)
-                y1 = max((y1 - pad_y) / scale, 0)
-                x2 = min((x2 - pad_x) / scale, w)
-                y2 = min((y2 - pad_y) / scale, h)
-                detections.append((x1, y1, x2, y2))
-
-        # Case 2: raw output (no NMS)
-        elif len(out.shape) == 3 and out.shape[-1] > 7:
-            preds = out[0]
-            # Note: This part needs proper NMS.
-            # This is a simplified stand-in.
-            # For a real application, you should add NMS here.
-            for det in preds:
-                obj_conf = det[4]
-                cls_conf = det[5:].max()
-                conf = obj_conf * cls_conf
-                if conf < self.conf_thresh:
-                    continue
-
-                x, y, bw, bh = det[:4]
-
-                # Reverse letterbox mapping
-                x1 = (x - bw / 2 - pad_x) / scale
-                y1 = (y - bh / 2 - pad_y) / scale
-                x2 = (x + bw / 2 - pad_x) / scale
-                y2 = (y + bh / 2 - pad_y) / scale
-
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(w, x2), min(h, y2)
-                detections.append((x1, y1, x2, y2))
-        
-        # --- NEW: Update tracker with current detections ---
-        # We pass detections in *original* frame coordinates
-        # The tracker will map them back to padded-space for tracking
-        self._update_tracker(detections, scale, pad_x, pad_y)
+        t2 = time.perf_counter()
+        inference_time = (t2 - t1) * 1000
 
+        detections = self.decode(outputs[0], scale, pad_x, pad_y, w, h)
+        self._record_timings(t0, t1, t2)
+        self._update_measured_fps()
+        return detections, scale, pad_x, pad_y, inference_time
 
-        # ---- Draw bounding boxes ----
-        frame_count = len(detections)
-        if draw:
-            overlay = frame.copy()
-            for (x1, y1, x2, y2) in detections:
-                cv2.rectangle(
-                    overlay,
-                    (int(x1), int(y1)),
-                    (int(x2), int(y2)),
-                    (0, 255, 0),
-                    1
-                )
-            
-            # Draw active track centers and IDs (in padded-space)
-            # We must map them back to original frame for drawing
-            for tid, (cx_pad, cy_pad, unseen) in self.active_tracks.items():
-                # Map from padded space back to original frame
-                cx_orig = int((cx_pad - pad_x) / scale)
-                cy_orig = int((cy_pad - pad_y) / scale)
-                
-                # Check if point is inside the original frame
-                if 0 <= cx_orig < w and 0 <= cy_orig < h:
-                    color = (0, 0, 255) if tid in self.counted_track_ids else (255, 0, 0)
-                    cv2.circle(overlay, (cx_orig, cy_orig), 4, color, -1)
-                    cv2.putText(overlay, str(tid), (cx_orig + 5, cy_orig + 5),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-
-            # Draw the counting line (mapped back to original frame)
-            # (x_line_pad - pad_x) / scale = x_line_orig
-            line_x_orig = int((self.counting_line_x - pad_x) / scale)
-            
-            # Check if the line is inside the frame's WIDTH
-            if 0 <= line_x_orig < w: 
-                # Draw a VERTICAL line from top (y=0) to bottom (y=h)
-                cv2.line(overlay, (line_x_orig, 0), (line_x_orig, h), (0, 255, 255), 2)
+    # ---------------------------------------------------------------
+    # Counting-band ROI
+    # ---------------------------------------------------------------
+    def roi_bounds(self, h, w):
+        """[x0, x1) column range of the counting band in original frame coords."""
+        scale, _, _, pad_x, _ = self._letterbox_params(h, w)
+        line_x = (self.counting_line_x - pad_x) / scale
+        half_width = self.roi_half_width
+        if half_width is None:
+            half_width = self.max_distance / scale
+        margin = self.roi_margin
+        if margin is None:
+            margin = self.max_distance / scale
+        x0 = max(0, int(line_x - half_width - margin))
+        x1 = min(w, int(np.ceil(line_x + half_width + margin)))
+        return x0, max(x1, x0 + 1)
+
+    def _infer_roi(self, frame, t0, stride=32):
+        """
+        infer() on the counting band only. Returns boxes in full-frame
+        coordinates with the full-frame letterbox parameters, so tracking,
+        counting and drawing are unchanged.
+        """
+        h, w = frame.shape[:2]
+        scale, _, _, pad_x, pad_y = self._letterbox_params(h, w)
+        x0, x1 = self.roi_bounds(h, w)
+        crop = frame[:, x0:x1]
+        ch, cw = crop.shape[:2]
+
+        if self.dynamic_input:
+            # Same scale as the full frame, so shrimp stay the size the model
+            # was trained on; the tensor is padded up to the model stride
+            roi_scale = scale
+            nw, nh = max(1, int(cw * scale)), max(1, int(ch * scale))
+            tw, th = -(-nw // stride) * stride, -(-nh // stride) * stride
+            left, top = (tw - nw) // 2, (th - nh) // 2
+        else:
+            th = tw = self.imgsz
+            roi_scale, nw, nh, left, top = self._letterbox_params(ch, cw)
+        input_tensor = self._letterbox_into(crop, th, tw, nw, nh, left, top)
+
+        t1 = time.perf_counter()
+        outputs = self.session.run(self.output_names, {self.input_name: input_tensor})
+        t2 = time.perf_counter()
+        inference_time = (t2 - t1) * 1000
 
-            # Semi-transparent overlay
-            frame = cv2.addWeighted(overlay, 0.6, frame, 0.4, 0)
+        detections = self.decode(outputs[0], roi_scale, left, top, cw, ch)
+        detections[:, 0::2] += x0
+        self._record_timings(t0, t1, t2)
+        self._update_measured_fps()
+        return detections, scale, pad_x, pad_y, inference_time
 
-            fps = int(1000 / inference_time) if inference_time > 0 else 0
-            
-            # --- NEW: Updated display text ---
-            display_text = f"{fps} FPS | Frame: {frame_count} | Total: {self.total_count}"
-            cv2.putText(
-                frame,
-                display_text,
-                (15, 40),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                1,
+    # ---------------------------------------------------------------
+    # Tiled inference
+    # ---------------------------------------------------------------
+    def tile_grid(self, h, w):
+        """
+        (x0, y0, x1, y1) imgsz tiles covering an h x w image, spread evenly
+        so that neighbours overlap by at least `tile_overlap` pixels.
+        """
+        size = self.imgsz
+        step = max(1, size - self.tile_overlap)
+
+        def starts(length):
+            if length <= size:
+                return [0]
+            n = -(-(length - size) // step) + 1
+            return [int(round(i * (length - size) / (n - 1))) for i in range(n)]
+
+        return [(x0, y0, min(x0 + size, w), min(y0 + size, h))
+                for y0 in starts(h) for x0 in starts(w)]
+
+    def _tiles_for(self, h, w):
+        """Cached tile grid and (B, 3, imgsz, imgsz) batch tensor for an h x w image."""
+        entry = self._tile_cache.get((h, w))
+        if entry is None:
+            tiles = self.tile_grid(h, w)
+            # Tiles smaller than imgsz (tiny frames) keep a grey border,
+            # painted once since the grid never changes
+            batch = np.full((len(tiles), 3, self.imgsz, self.imgsz),
+                            114.0 / 255.0, dtype=np.float32)
+            entry = self._tile_cache[(h, w)] = (tiles, batch)
+        return entry
+
+    def _infer_tiled(self, frame, t0):
+        """
+        infer() as one batched session.run over overlapping native-resolution
+        tiles. Tile detections are merged with class-agnostic NMS, then boxes
+        clipped by an inner seam are dropped when the neighbouring tile saw
+        the whole shrimp. In ROI mode only the counting band is tiled.
+        """
+        h, w = frame.shape[:2]
+        scale, _, _, pad_x, pad_y = self._letterbox_params(h, w)
+        x_off = 0
+        if self.roi_mode:
+            x_off, x1 = self.roi_bounds(h, w)
+            frame = frame[:, x_off:x1]
+        fh, fw = frame.shape[:2]
+
+        tiles, batch = self._tiles_for(fh, fw)
+        for i, (x0, y0, x1, y1) in enumerate(tiles):
+            np.multiply(
+                frame[y0:y1, x0:x1, ::-1].transpose(2, 0, 1),
+                np.float32(1.0 / 255.0),
+                out=batch[i, :, :y1 - y0, :x1 - x0],
+                dtype=np.float32,
+            )
+
+        t1 = time.perf_counter()
+        if self.dynamic_batch:
+            outputs = self.session.run(self.output_names, {self.input_name: batch})[0]
+            tile_outputs = [outputs[i:i + 1] for i in range(len(tiles))]
+        else:
+            tile_outputs = [
+                self.session.run(self.output_names, {self.input_name: batch[i:i + 1]})[0]
+                for i in range(len(tiles))
+            ]
+        t2 = time.perf_counter()
+        inference_time = (t2 - t1) * 1000
+
+        all_boxes, all_scores, seam_cut = [], [], []
+        for out, (x0, y0, x1, y1) in zip(tile_outputs, tiles):
+            boxes, scores = self.decode(out, 1.0, 0, 0, x1 - x0, y1 - y0,
+                                        return_scores=True)
+            boxes[:, 0::2] += x0
+            boxes[:, 1::2] += y0
+            # Touching an edge of this tile that is not an edge of the frame
+            edge = 1.0
+            cut = np.zeros(len(boxes), dtype=bool)
+            if x0 > 0:
+                cut |= boxes[:, 0] <= x0 + edge
+            if y0 > 0:
+                cut |= boxes[:, 1] <= y0 + edge
+            if x1 < fw:
+                cut |= boxes[:, 2] >= x1 - edge
+            if y1 < fh:
+                cut |= boxes[:, 3] >= y1 - edge
+            all_boxes.append(boxes)
+            all_scores.append(scores)
+            seam_cut.append(cut)
+
+        boxes = np.concatenate(all_boxes)
+        scores = np.concatenate(all_scores)
+        cut = np.concatenate(seam_cut)
+        # Rank seam-clipped boxes below whole ones so NMS keeps the whole box
+        keep = non_max_suppression(boxes, scores - cut, iou_thresh=self.iou_thresh,
+                                   max_det=self.max_det, top_k=self.nms_top_k)
+        boxes, cut = boxes[keep], cut[keep]
+
+        # A seam-clipped fragment overlaps the whole box too little for IoU
+        # suppression; drop it when it lies mostly inside an uncut box
+        if cut.any() and not cut.all():
+            frag, whole = boxes[cut], boxes[~cut]
+            iw = (np.minimum(frag[:, None, 2], whole[None, :, 2])
+                  - np.maximum(frag[:, None, 0], whole[None, :, 0]))
+            ih = (np.minimum(frag[:, None, 3], whole[None, :, 3])
+                  - np.maximum(frag[:, None, 1], whole[None, :, 1]))
+            inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+            area = ((frag[:, 2] - frag[:, 0]) * (frag[:, 3] - frag[:, 1]))[:, None]
+            covered = (inter / (area + 1e-9)).max(axis=1) > 0.5
+            drop = np.flatnonzero(cut)[covered]
+            boxes = np.delete(boxes, drop, axis=0)
+
+        boxes[:, 0::2] += x_off
+        self._record_timings(t0, t1, t2)
+        self._update_measured_fps()
+        return boxes, scale, pad_x, pad_y, inference_time
+
+    def gated_infer(self, frame):
+        """
+        infer() behind the motion gate. When the scene is static the last
+        result is reused instead of running the model.
+
+        Returns (inferred, skipped).
+        """
+        if self.motion_gate is not None:
+            moving = self.motion_gate.should_infer(frame)
+            if not moving and self._last_inferred is not None:
+                metrics.inc("frames_skipped")
+                return self._last_inferred, True
+        self._last_inferred = self.infer(frame)
+        metrics.inc("frames_inferred")
+        return self._last_inferred, False
+
+    def _record_timings(self, t0, t1, t2):
+        """Per-stage ms of the last inference: t0 -> t1 preprocess, t1 -> t2 session.run, t2 -> now decode."""
+        self.last_timings = {
+            "preprocess": (t1 - t0) * 1000,
+            "inference": (t2 - t1) * 1000,
+            "decode": (time.perf_counter() - t2) * 1000,
+        }
+        for name, ms in self.last_timings.items():
+            metrics.observe(name, ms)
+
+    def _update_measured_fps(self):
+        now = time.monotonic()
+        if self._last_infer_time is not None:
+            dt = now - self._last_infer_time
+            if dt > 0:
+                fps = 1.0 / dt
+                self.measured_fps = fps if self.measured_fps == 0 else 0.9 * self.measured_fps + 0.1 * fps
+        self._last_infer_time = now
+
+    def performance_report(self):
+        """Active session profile and measured detector rate."""
+        return {
+            "profile": self.profile,
+            "precision": self.precision,
+            "measured_fps": round(self.measured_fps, 1),
+            "motion_gate": self.motion_gate.stats() if self.motion_gate else None,
+        }
+
+    def track_snapshot(self):
+        """Copy of the tracker state for drawing from another thread."""
+        return self.active_tracks, frozenset(self.counted_track_ids), self.total_count
+
+    def overlay_items(self, detections, scale, pad_x, pad_y, inference_time,
+                      w, h, snapshot=None):
+        """
+        Everything draw() paints, mapped to original w x h frame coordinates.
+
+        Lets the GUI paint the overlay itself (e.g. over a newer camera
+        frame) without touching pixels here.
+        """
+        if snapshot is None:
+            snapshot = self.active_tracks, self.counted_track_ids, self.total_count
+        tracks, counted_ids, total_count = snapshot
+
+        # Track centres live in padded space; map them back to the frame
+        points = []
+        for tid, (cx_pad, cy_pad, unseen) in tracks.items():
+            cx_orig = int((cx_pad - pad_x) / scale)
+            cy_orig = int((cy_pad - pad_y) / scale)
+            if 0 <= cx_orig < w and 0 <= cy_orig < h:
+                points.append((cx_orig, cy_orig, tid, tid in counted_ids))
+
+        # (x_line_pad - pad_x) / scale = x_line_orig
+        line_x = int((self.counting_line_x - pad_x) / scale)
+        return Overlay(
+            boxes=np.asarray(detections).astype(np.int32).reshape(-1, 4),
+            points=points,
+            line_x=line_x if 0 <= line_x < w else None,
+            status=f"{self.measured_fps:.0f} FPS | Frame: {len(detections)} | Total: {total_count}",
+            detail=f"profile: {self.profile} | inference: {inference_time:.0f} ms",
+        )
+
+    def draw(self, frame, detections, scale, pad_x, pad_y, inference_time,
+             snapshot=None, in_place=False):
+        """
+        Draw boxes, track IDs, the counting line and the status text.
+
+        `snapshot` is a track_snapshot() taken right after tracking; when
+        omitted the live tracker state is used. Returns a new BGR frame
+        with a semi-transparent overlay, or with in_place=True draws opaque
+        marks straight onto `frame` and returns it (no full-frame copies).
+        """
+        start = time.perf_counter()
+        h, w = frame.shape[:2]
+        items = self.overlay_items(detections, scale, pad_x, pad_y, inference_time,
+                                   w, h, snapshot=snapshot)
+
+        # ---- Draw bounding boxes ----
+        if in_place and not frame.flags.writeable:
+            # Read-only frames (raw recording memmaps) are drawn on a copy
+            frame = frame.copy()
+        overlay = frame if in_place else frame.copy()
+        for (x1, y1, x2, y2) in items.boxes:
+            cv2.rectangle(
+                overlay,
+                (int(x1), int(y1)),
+                (int(x2), int(y2)),
                 (0, 255, 0),
-                2,
+                1
             )
 
+        # Draw active track centers and IDs
+        for cx, cy, tid, counted in items.points:
+            color = (0, 0, 255) if counted else (255, 0, 0)
+            cv2.circle(overlay, (cx, cy), 4, color, -1)
+            cv2.putText(overlay, str(tid), (cx + 5, cy + 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+        # Draw a VERTICAL counting line from top (y=0) to bottom (y=h)
+        if items.line_x is not None:
+            cv2.line(overlay, (items.line_x, 0), (items.line_x, h), (0, 255, 255), 2)
+
+        # Semi-transparent overlay
+        if not in_place:
+            frame = cv2.addWeighted(overlay, 0.6, frame, 0.4, 0)
+
+        cv2.putText(
+            frame,
+            items.status,
+            (15, 40),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 255, 0),
+            2,
+        )
+        cv2.putText(
+            frame,
+            items.detail,
+            (15, 65),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (0, 255, 0),
+            1,
+        )
+        metrics.observe("draw", (time.perf_counter() - start) * 1000)
+        return frame
+
+    def detect(self, frame, draw=True, dt=1, rgb=True):
+        """
+        Infer, track and (optionally) draw one frame; returns (total_count, frame).
+
+        rgb=True returns a new RGB frame. rgb=False keeps BGR end to end and
+        draws onto `frame` in place, for QImage.Format_BGR888 / cv2.imshow.
+        """
+        if self.session is None:
+            return 0, frame
+
+        inferred, skipped = self.gated_infer(frame)
+        detections, scale, pad_x, pad_y, inference_time = inferred
+
+        # --- NEW: Update tracker with current detections ---
+        # We pass detections in *original* frame coordinates
+        # The tracker will map them back to padded-space for tracking
+        self.update_tracks(inferred, skipped, dt=dt)
+
+        if draw:
+            frame = self.draw(frame, detections, scale, pad_x, pad_y, inference_time,
+                              in_place=not rgb)
+
+        if not rgb:
+            return self.total_count, frame
         # Return frame as RGB for PyQt display
         return self.total_count, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
@@ -341,24 +933,27 @@ class ShrimpDetector:
 # Stand-alone camera test (optional)
 # ---------------------------------------------------------------
 if __name__ == "__main__":
+    import argparse
+    from frame_sources import open_source
+
+    parser = argparse.ArgumentParser(description="Stand-alone detector test")
+    parser.add_argument("--source", default="camera",
+                        help="camera, synthetic[:N], video file, frame folder or .raw recording")
+    parser.add_argument("--loop", action="store_true", help="Restart file sources at the end")
+    args = parser.parse_args()
+
     detector = ShrimpDetector("models/YOLOshrimp.onnx", conf_thresh=0.25, imgsz=416)
-    cap = cv2.VideoCapture(0)
-    
-    # Set camera resolution (optional, but good for consistency)
-    # cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    source = open_source(args.source, loop=args.loop)
 
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            frame = source.get_frame()
+            if frame is None:
                 print("Failed to grab frame")
                 break
 
-            count, vis = detector.detect(frame, draw=True)
-            
-            # Convert back to BGR for cv2.imshow
-            cv2.imshow("Shrimp Detector", cv2.cvtColor(vis, cv2.COLOR_RGB2BGR))
+            count, vis = detector.detect(frame, draw=True, rgb=False)
+            cv2.imshow("Shrimp Detector", vis)
             
             if cv2.waitKey(1) == 27: # Press 'ESC' to quit
                 break
@@ -366,5 +961,5 @@ if __name__ == "__main__":
     finally:
         # --- NEW: Save the count on exit ---
         detector.save_count()
-        cap.release()
-        cv2.destroyAllWindows()
\ No newline at end of file
+        source.release()
+        cv2.destroyAllWindows()
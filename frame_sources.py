@@ -0,0 +1,380 @@
+"""
+Frame sources that stand in for the camera.
+
+Every source offers the part of the Camera API the app uses (get_frame,
+peek_latest, release, `threaded`), so DetectionPipeline, BiomassWindow and
+the detector test runner take any of them:
+
+    VideoFileSource      a video file (cv2.VideoCapture)
+    ImageDirSource       a folder of stills, or a single image
+    SyntheticSource      moving shrimp-like blobs, no files needed
+    RawRecordingSource   a memory-mapped raw recording (see RawRecorder)
+
+Raw recordings are fixed-size records (float64 timestamp + one HxWxC uint8
+frame) behind a 64-byte header, so replaying one is zero-copy and exactly
+repeatable. Record any source with:
+
+    python frame_sources.py record captures/run1.mp4 captures/run1.raw
+
+open_source() picks a source from a spec string ("camera", "synthetic",
+"synthetic:200", a video file, an image folder or a .raw file), which is
+what SHRIMP_FRAME_SOURCE and the --source options accept.
+"""
+import argparse, glob, os, struct, time
+import cv2
+import numpy as np
+
+from camera import Camera, CapturedFrame
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".h264")
+RAW_EXTENSION = ".raw"
+
+
+def list_frames(path, max_frames=None):
+    """Image files under `path` (a folder or a single image), sorted by name."""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(
+            f for f in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    if max_frames:
+        files = files[:max_frames]
+    return files
+
+
+class FrameSource:
+    """
+    Base class: subclasses implement _read() -> (image, source_time) or None.
+
+    With realtime=True frames are paced by their source timestamps, as a
+    camera would deliver them; with realtime=False they come as fast as
+    they are asked for (benchmarks, replays). Sources are not threaded:
+    the pipeline reads them with get_frame().
+    """
+
+    threaded = False
+    dropped_frames = 0
+
+    def __init__(self, realtime=True, loop=False):
+        self.realtime = realtime
+        self.loop = loop
+        self._seq = 0
+        self._latest = None
+        self._anchor = None         # (wall time, source time) for realtime pacing
+        self.last_source_time = None  # timeline position of the last frame read
+
+    @property
+    def endless(self):
+        """True when read() never returns None on its own."""
+        return self.loop
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _rewind(self):
+        """Restart from the first frame; return False if the source cannot."""
+        return False
+
+    def read(self):
+        """The next CapturedFrame, or None when the source is exhausted."""
+        item = self._read()
+        if item is None and self.loop and self._rewind():
+            item = self._read()
+        if item is None:
+            return None
+        image, source_time = item
+
+        if self.realtime:
+            now = time.monotonic()
+            if self._anchor is None or source_time < self.last_source_time:
+                self._anchor = (now, source_time)
+            due = self._anchor[0] + (source_time - self._anchor[1])
+            if due > now:
+                time.sleep(due - now)
+        self.last_source_time = source_time
+
+        self._seq += 1
+        self._latest = CapturedFrame(image, time.monotonic(), self._seq)
+        return self._latest
+
+    def get_frame(self):
+        captured = self.read()
+        return captured.image if captured is not None else None
+
+    def peek_latest(self):
+        return self._latest
+
+    def __iter__(self):
+        while True:
+            captured = self.read()
+            if captured is None:
+                return
+            yield captured
+
+    def release(self):
+        pass
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, realtime=True, loop=False):
+        super().__init__(realtime, loop)
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self._index = 0
+
+    def _read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self._index += 1
+        return frame, (self._index - 1) / self.fps
+
+    def _rewind(self):
+        self._index = 0
+        return self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    def __init__(self, path, fps=10.0, realtime=True, loop=False, max_frames=None):
+        super().__init__(realtime, loop)
+        self.files = list_frames(path, max_frames)
+        if not self.files:
+            raise IOError(f"No frames found in {path}")
+        self.fps = fps
+        self._index = 0
+
+    def _read(self):
+        while self._index < len(self.files):
+            f = self.files[self._index]
+            self._index += 1
+            frame = cv2.imread(f)
+            if frame is None:
+                print(f"Skipping unreadable frame: {f}")
+                continue
+            return frame, (self._index - 1) / self.fps
+        return None
+
+    def _rewind(self):
+        self._index = 0
+        return True
+
+
+class SyntheticSource(FrameSource):
+    """
+    Shrimp-like blobs drifting left to right over a noisy tank background.
+    Deterministic for a given seed; endless unless `max_frames` is set.
+    """
+
+    def __init__(self, count=20, width=640, height=480, speed=4.0, fps=30.0,
+                 seed=0, max_frames=None, realtime=True):
+        super().__init__(realtime)
+        self.width, self.height = width, height
+        self.speed = speed
+        self.fps = fps
+        self.max_frames = max_frames
+        self._rng = np.random.default_rng(seed)
+        self._pos = self._rng.uniform((0, 20), (width, height - 20), size=(count, 2))
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[:] = (70, 90, 60)
+        self._index = 0
+
+    @property
+    def endless(self):
+        return self.max_frames is None
+
+    def _read(self):
+        if self.max_frames is not None and self._index >= self.max_frames:
+            return None
+        frame = self._background.copy()
+        frame += self._rng.integers(0, 12, size=(self.height, self.width, 1), dtype=np.uint8)
+        for x, y in self._pos.astype(np.int32):
+            cv2.ellipse(frame, (int(x), int(y)), (9, 3), 0, 0, 360, (200, 210, 220), -1)
+        self._pos[:, 0] = (self._pos[:, 0] + self.speed) % self.width
+        self._index += 1
+        return frame, (self._index - 1) / self.fps
+
+
+# ---------------------------------------------------------------
+# Raw recordings
+# ---------------------------------------------------------------
+RAW_MAGIC = b"SHRMRAW1"
+RAW_HEADER = struct.Struct("<8sIIIQ")   # magic, height, width, channels, frame count
+RAW_HEADER_SIZE = 64
+
+
+def raw_record_dtype(height, width, channels=3):
+    return np.dtype([("timestamp", "<f8"), ("image", np.uint8, (height, width, channels))])
+
+
+class RawRecorder:
+    """Appends fixed-size (timestamp, frame) records to a raw recording."""
+
+    def __init__(self, path, height, width, channels=3):
+        self.path = path
+        self.shape = (height, width, channels)
+        self.count = 0
+        self._timestamp = np.empty(1, dtype="<f8")
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(RAW_HEADER.pack(RAW_MAGIC, *self.shape, self.count)
+                         .ljust(RAW_HEADER_SIZE, b"\0"))
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, image, timestamp):
+        if image.shape != self.shape:
+            raise ValueError(f"Frame shape {image.shape} does not match recording {self.shape}")
+        self._timestamp[0] = timestamp
+        self._file.write(self._timestamp.tobytes())
+        self._file.write(np.ascontiguousarray(image).tobytes())
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._write_header()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawRecordingSource(FrameSource):
+    """
+    Replays a RawRecorder file through a read-only memmap: frames are views
+    into the page cache, never decoded or copied, and pacing follows the
+    recorded timestamps.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        super().__init__(realtime, loop)
+        self.path = path
+        with open(path, "rb") as f:
+            magic, height, width, channels, _ = RAW_HEADER.unpack(f.read(RAW_HEADER.size))
+        if magic != RAW_MAGIC:
+            raise IOError(f"Not a raw frame recording: {path}")
+        dtype = raw_record_dtype(height, width, channels)
+        # Count from the file size, so an interrupted recording still plays
+        count = (os.path.getsize(path) - RAW_HEADER_SIZE) // dtype.itemsize
+        self.records = np.memmap(path, dtype=dtype, mode="r",
+                                 offset=RAW_HEADER_SIZE, shape=(count,))
+        self.timestamps = self.records["timestamp"]
+        self._index = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def _read(self):
+        if self._index >= len(self.records):
+            return None
+        record = self.records[self._index]
+        self._index += 1
+        return record["image"], float(record["timestamp"])
+
+    def _rewind(self):
+        self._index = 0
+        return True
+
+    def release(self):
+        # Drop the mapping; frames already handed out keep it alive
+        self.records = self.timestamps = None
+
+
+def _camera_frames(camera):
+    """Every new frame of a threaded Camera, forever."""
+    last_seq = 0
+    while True:
+        captured = camera.get_latest(wait=True, timeout=1.0)
+        if captured is not None and captured.seq > last_seq:
+            last_seq = captured.seq
+            yield captured
+
+
+def record(source, path, max_frames=None):
+    """
+    Copy frames from `source` (a FrameSource or threaded Camera) into a raw
+    recording at `path`. File sources keep their own timeline, camera
+    frames their capture time. Returns the frame count.
+    """
+    recorder = None
+    is_file = isinstance(source, FrameSource)
+    frames = iter(source) if is_file else _camera_frames(source)
+    try:
+        for n, captured in enumerate(frames):
+            if max_frames is not None and n >= max_frames:
+                break
+            if recorder is None:
+                recorder = RawRecorder(path, *captured.image.shape)
+            timestamp = source.last_source_time if is_file else captured.timestamp
+            recorder.write(captured.image, timestamp)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    return recorder.count if recorder is not None else 0
+
+
+# ---------------------------------------------------------------
+# Selection
+# ---------------------------------------------------------------
+def open_source(spec=None, realtime=True, loop=False, **kwargs):
+    """
+    Open the frame source named by `spec`:
+
+        None / "camera"         the tank camera (threaded Camera)
+        "synthetic[:COUNT]"     SyntheticSource with COUNT shrimp
+        "*.raw"                 RawRecordingSource
+        video file              VideoFileSource
+        folder or image file    ImageDirSource
+    """
+    if spec in (None, "", "camera"):
+        return Camera(threaded=True, **kwargs)
+    if spec.startswith("synthetic"):
+        _, _, count = spec.partition(":")
+        return SyntheticSource(count=int(count or 20), realtime=realtime, **kwargs)
+    if spec.lower().endswith(RAW_EXTENSION):
+        return RawRecordingSource(spec, realtime=realtime, loop=loop)
+    if os.path.isfile(spec) and spec.lower().endswith(VIDEO_EXTENSIONS):
+        return VideoFileSource(spec, realtime=realtime, loop=loop)
+    if os.path.exists(spec):
+        return ImageDirSource(spec, realtime=realtime, loop=loop, **kwargs)
+    raise ValueError(f"Unknown frame source '{spec}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame source tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="Record a source into a raw memmap file")
+    rec.add_argument("source", help="camera, synthetic[:N], video file, folder or image")
+    rec.add_argument("output", help="Raw recording to write (.raw)")
+    rec.add_argument("--max-frames", type=int, default=None)
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=False)
+    # The camera and synthetic scenes never run out: without a limit the
+    # recording would grow until the disk is full
+    if args.max_frames is None and getattr(source, "endless", True):
+        source.release()
+        parser.error(f"'{args.source}' is endless, recording it needs --max-frames")
+    try:
+        n = record(source, args.output, args.max_frames)
+    finally:
+        source.release()
+    print(f"Recorded {n} frame(s) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,294 @@
+"""
+Process-wide latency metrics: rolling histograms and counters.
+
+Every hot stage records into the shared REGISTRY:
+
+    capture_wait, preprocess, inference, decode, track, draw,
+    ui_paint, frame_latency, sqlite_write, mqtt_publish, sync_batch
+
+Recording is one lock, one deque append and one bucket increment, so it
+is cheap enough to leave on in the field. Two views come out of it:
+
+    REGISTRY.snapshot()           rolling p50/p95/p99 and rate per stage,
+                                  for the on-screen diagnostics overlay
+    REGISTRY.prometheus_text()    Prometheus text exposition (cumulative
+                                  buckets plus rolling quantiles)
+
+and two ways to export the text without a Prometheus client library:
+
+    SHRIMP_METRICS_PORT=9108      serve http://127.0.0.1:9108/metrics
+    SHRIMP_METRICS_FILE=path.prom rewrite the file every few seconds
+                                  (node_exporter textfile collector)
+
+start_exporters() reads both variables; the app calls it once at startup.
+"""
+import bisect, os, threading, time
+from collections import deque
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+PREFIX = "shrimp"
+# Upper bounds (ms) of the cumulative Prometheus buckets
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    """
+    Millisecond samples: cumulative buckets since start, plus the last
+    `window` samples (no older than `window_s`) for rolling quantiles.
+    """
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS_MS, window=2048, window_s=60.0):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(buckets)
+        self.window_s = window_s
+        self._counts = [0] * (len(self.bounds) + 1)   # last slot is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._recent = deque(maxlen=window)            # (monotonic time, ms)
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, ms)] += 1
+            self._count += 1
+            self._sum += ms
+            self._recent.append((time.monotonic(), ms))
+
+    def snapshot(self):
+        """Rolling figures over the window: count, rate/s, mean, p50/p95/p99, max."""
+        now = time.monotonic()
+        with self._lock:
+            recent = [ms for t, ms in self._recent if now - t <= self.window_s]
+            oldest = next((t for t, _ in self._recent if now - t <= self.window_s), now)
+            total = self._count
+        result = {"total": total, "count": len(recent), "rate": 0.0}
+        if recent:
+            arr = np.asarray(recent)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            span = now - oldest
+            result.update(
+                rate=len(recent) / span if span > 0 else 0.0,
+                mean_ms=float(arr.mean()),
+                p50_ms=float(p50),
+                p95_ms=float(p95),
+                p99_ms=float(p99),
+                max_ms=float(arr.max()),
+            )
+        return result
+
+    def prometheus_lines(self):
+        name = f"{PREFIX}_{self.name}_ms"
+        with self._lock:
+            counts, count, total = list(self._counts), self._count, self._sum
+        lines = [f"# HELP {name} {self.help or self.name} (milliseconds)",
+                 f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{name}_sum {total:.3f}")
+        lines.append(f"{name}_count {count}")
+
+        snap = self.snapshot()
+        if snap["count"]:
+            recent = f"{name}_recent"
+            lines.append(f"# HELP {recent} {self.help or self.name}, last {self.window_s:g} s")
+            lines.append(f"# TYPE {recent} summary")
+            for q, key in ((0.5, "p50_ms"), (0.95, "p95_ms"), (0.99, "p99_ms")):
+                lines.append(f'{recent}{{quantile="{q}"}} {snap[key]:.3f}')
+            lines.append(f"{recent}_count {snap['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic event count (frames dropped, publish failures, ...)."""
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def prometheus_lines(self):
+        name = f"{PREFIX}_{self.name}_total"
+        return [f"# HELP {name} {self.help or self.name}",
+                f"# TYPE {name} counter",
+                f"{name} {self.value}"]
+
+
+class _Timer(ContextDecorator):
+    """`with timed(name):` or `@timed(name)`: observe the elapsed ms."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._start = threading.local()
+
+    def __enter__(self):
+        self._start.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self._start.t) * 1000)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help="", **kwargs):
+        """Get or create the histogram `name`."""
+        h = self.histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault(name, Histogram(name, help, **kwargs))
+        return h
+
+    def counter(self, name, help=""):
+        c = self.counters.get(name)
+        if c is None:
+            with self._lock:
+                c = self.counters.setdefault(name, Counter(name, help))
+        return c
+
+    def observe(self, name, ms):
+        self.histogram(name).observe(ms)
+
+    def inc(self, name, n=1):
+        self.counter(name).inc(n)
+
+    def timed(self, name):
+        return _Timer(self.histogram(name))
+
+    def snapshot(self):
+        return {
+            "histograms": {name: h.snapshot() for name, h in list(self.histograms.items())},
+            "counters": {name: c.value for name, c in list(self.counters.items())},
+        }
+
+    def prometheus_text(self):
+        lines = []
+        for h in list(self.histograms.values()):
+            lines.extend(h.prometheus_lines())
+        for c in list(self.counters.values()):
+            lines.extend(c.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def format_table(self):
+        """Fixed-width lines for the on-screen diagnostics overlay."""
+        snap = self.snapshot()
+        lines = [f"{'stage':<14}{'p50':>8}{'p95':>8}{'p99':>8}{'/s':>8}"]
+        for name, s in snap["histograms"].items():
+            if s["count"]:
+                lines.append(f"{name:<14}{s['p50_ms']:8.1f}{s['p95_ms']:8.1f}"
+                             f"{s['p99_ms']:8.1f}{s['rate']:8.1f}")
+            else:
+                lines.append(f"{name:<14}{'-':>8}{'-':>8}{'-':>8}{0:8.1f}")
+        for name, value in snap["counters"].items():
+            lines.append(f"{name:<30}{value:>16}")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+# Fixed stage order in reports, whether or not a stage has run yet
+for _name, _help in (
+    ("capture_wait", "Time the pipeline waited for a new camera frame"),
+    ("preprocess", "Letterbox and tensor fill"),
+    ("inference", "ONNX Runtime session.run"),
+    ("decode", "Box decode and NMS"),
+    ("track", "Tracker update and line counting"),
+    ("draw", "Overlay drawing or overlay item preparation"),
+    ("ui_paint", "VideoLabel paintEvent"),
+    ("frame_latency", "Capture to GUI delivery"),
+    ("sqlite_write", "Local database writes"),
+    ("mqtt_publish", "MQTT publish calls"),
+    ("sync_batch", "Background MongoDB sync batch"),
+):
+    REGISTRY.histogram(_name, _help)
+
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+timed = REGISTRY.timed
+
+
+# ---------------------------------------------------------------
+# Exporters
+# ---------------------------------------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics on a daemon thread; returns the server."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+    print(f"Metrics: serving http://{host}:{port}/metrics")
+    return server
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Atomically replace `path` with the current exposition text."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.prometheus_text())
+    os.replace(tmp, path)
+
+
+def start_textfile_writer(path, interval_s=5.0, registry=REGISTRY):
+    """Rewrite `path` every `interval_s` seconds on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                write_textfile(path, registry)
+            except OSError as e:
+                print(f"Metrics: could not write {path}: {e}")
+            time.sleep(interval_s)
+    threading.Thread(target=loop, name="MetricsFile", daemon=True).start()
+    print(f"Metrics: writing {path} every {interval_s:g} s")
+
+
+_exporters_started = False
+
+
+def start_exporters():
+    """Start the exporters named by SHRIMP_METRICS_PORT / SHRIMP_METRICS_FILE (once)."""
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+    port = os.environ.get("SHRIMP_METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port))
+        except (OSError, ValueError) as e:
+            print(f"Metrics: could not serve on port {port}: {e}")
+    path = os.environ.get("SHRIMP_METRICS_FILE")
+    if path:
+        start_textfile_writer(path)
@@ -0,0 +1,339 @@
+"""
+Microbenchmarks for the hot paths, with stored baselines.
+
+Runs on any Linux box without a camera: the detector is loaded with a
+tiny synthetic ONNX model (built with the `onnx` helper when available)
+and the database calls run against a temporary SQLite file.
+
+    python microbench.py --save-baseline          # record this machine's baseline
+    python microbench.py                          # compare, exit 1 on regression
+    python microbench.py --tolerance 0.5 --only tracker
+
+A benchmark regresses when its median time per call exceeds the baseline
+by more than `--tolerance` (a fraction, 0.25 = 25% slower).
+"""
+import argparse, contextlib, json, os, shutil, sqlite3, sys, tempfile, time
+import numpy as np
+
+from compute import compute_feed
+from detector import ShrimpDetector
+from replay import machine_info
+
+DEFAULT_BASELINE = "microbench_baseline.json"
+FRAME_SIZE = (480, 640)     # what the Camera delivers
+DB_ROWS = 10_000
+
+BENCHMARKS = []
+
+
+def benchmark(name, quiet=False):
+    """
+    Register `setup(ctx)`; it returns the zero-argument callable to time.
+    quiet=True sends stdout to /dev/null while timing (the tracking path
+    prints every counted shrimp).
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup, quiet))
+        return setup
+    return register
+
+
+# ---------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------
+def make_synthetic_model(path, imgsz=416, channels=8):
+    """
+    Write a tiny YOLO-shaped model: (1, 3, imgsz, imgsz) -> (1, N, channels)
+    raw predictions from a single strided convolution. Returns False when
+    the `onnx` package is not installed.
+    """
+    try:
+        import onnx
+        from onnx import TensorProto, helper, numpy_helper
+    except ImportError:
+        return False
+
+    cells = (imgsz // 32) ** 2
+    rng = np.random.default_rng(0)
+    weight = numpy_helper.from_array(
+        (rng.normal(size=(channels, 3, 32, 32)) * 0.01).astype(np.float32), "W")
+    shape = numpy_helper.from_array(np.array([1, channels, -1], dtype=np.int64), "shape")
+    nodes = [
+        helper.make_node("Conv", ["images", "W"], ["conv"], kernel_shape=[32, 32], strides=[32, 32]),
+        helper.make_node("Reshape", ["conv", "shape"], ["flat"]),
+        helper.make_node("Transpose", ["flat"], ["output0"], perm=[0, 2, 1]),
+    ]
+    graph = helper.make_graph(
+        nodes, "synthetic_shrimp",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [1, 3, imgsz, imgsz])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [1, cells, channels])],
+        [weight, shape],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return True
+
+
+def synthetic_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(*FRAME_SIZE, 3), dtype=np.uint8)
+
+
+def moving_boxes(n, steps, speed=3.0, size=14.0, seed=0):
+    """`steps` frames of (n, 4) boxes drifting right across the frame (wrapping)."""
+    h, w = FRAME_SIZE
+    rng = np.random.default_rng(seed)
+    start = rng.uniform((0, 0), (w, h - size), size=(n, 2))
+    frames = []
+    for t in range(steps):
+        xy = start + (speed * t, 0)
+        xy[:, 0] %= w - size
+        frames.append(np.hstack([xy, xy + size]).astype(np.float32))
+    return frames
+
+
+class Context:
+    """Shared, lazily built fixtures for one suite run."""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self._detector = None
+
+    def detector(self):
+        if self._detector is None:
+            model = os.path.join(self.workdir, "synthetic.onnx")
+            if not make_synthetic_model(model):
+                print("onnx not installed: benchmarking without a model session")
+            self._detector = ShrimpDetector(model, cache_optimized=False)
+        return self._detector
+
+    def fresh_detector(self):
+        det = self.detector()
+        det.tracker.reset()
+        det.total_count = 0
+        return det
+
+
+# ---------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------
+@benchmark("preprocess")
+def bench_preprocess(ctx):
+    det, frame = ctx.detector(), synthetic_frame()
+    return lambda: det.preprocess(frame)
+
+
+@benchmark("inference")
+def bench_inference(ctx):
+    det = ctx.detector()
+    if det.session is None:
+        raise RuntimeError("no model session")
+    tensor = det.preprocess(synthetic_frame())[0]
+    feed = {det.input_name: tensor}
+    return lambda: det.session.run(det.output_names, feed)
+
+
+@benchmark("decode")
+def bench_decode(ctx):
+    # Raw YOLO output at 416: 10647 candidates, ~150 above the threshold
+    det = ctx.detector()
+    rng = np.random.default_rng(0)
+    n = 10647
+    out = np.zeros((1, n, 8), dtype=np.float32)
+    out[0, :, :2] = rng.uniform(0, det.imgsz, size=(n, 2))
+    out[0, :, 2:4] = rng.uniform(6, 20, size=(n, 2))
+    out[0, :, 4] = rng.uniform(0, 0.28, size=n)
+    out[0, :, 5:] = rng.uniform(0.5, 1.0, size=(n, 3))
+    scale, _, _, pad_x, pad_y = det._letterbox_params(*FRAME_SIZE)
+    h, w = FRAME_SIZE
+    return lambda: det.decode(out, scale, pad_x, pad_y, w, h)
+
+
+def _tracker_bench(n):
+    def setup(ctx):
+        det = ctx.fresh_detector()
+        frames = moving_boxes(n, steps=64)
+        scale, _, _, pad_x, pad_y = det._letterbox_params(*FRAME_SIZE)
+        # Warm up so the timed calls see n established tracks
+        for boxes in frames[:8]:
+            det._update_tracker(boxes, scale, pad_x, pad_y)
+        state = {"i": 8}
+
+        def step():
+            det._update_tracker(frames[state["i"] % len(frames)], scale, pad_x, pad_y)
+            state["i"] += 1
+        return step
+    return setup
+
+
+for _n in (10, 100, 500):
+    benchmark(f"tracker_{_n}", quiet=True)(_tracker_bench(_n))
+
+
+@benchmark("compute_feed")
+def bench_compute_feed(ctx):
+    return lambda: compute_feed(1234)
+
+
+def _database(ctx, name):
+    """
+    database module pointed at a fresh copy of a temp DB holding DB_ROWS
+    records for one owner, so rows saved by one benchmark never enlarge
+    the table another one reads.
+    """
+    import database
+    seed = os.path.join(ctx.workdir, "seed.db")
+    if not os.path.exists(seed):
+        database.DB_PATH = seed
+        database.init_db()
+        database.close_connections()
+        conn = sqlite3.connect(seed)
+        conn.executemany(
+            "INSERT INTO biomass_records(ownerId, recordId, shrimpCount, biomass, "
+            "feedMeasurement, dateTime, synced) VALUES(?,?,?,?,?,?,0)",
+            (("bench-owner", f"rec-{i}", i, i * 0.01, i * 0.0006,
+              "2025-01-01T00:00:00") for i in range(DB_ROWS)),
+        )
+        conn.commit()
+        conn.close()
+    database.DB_PATH = os.path.join(ctx.workdir, f"{name}.db")
+    shutil.copyfile(seed, database.DB_PATH)
+    return database
+
+
+@benchmark("db_save_biomass_record")
+def bench_db_save(ctx):
+    database = _database(ctx, "save")
+    return lambda: database.save_biomass_record("bench-owner", 100, 1.0, 0.06)
+
+
+@benchmark("db_get_all_records")
+def bench_db_get_all(ctx):
+    database = _database(ctx, "get_all")
+    return lambda: database.get_all_records("bench-owner")
+
+
+@benchmark("db_get_last_record")
+def bench_db_get_last(ctx):
+    database = _database(ctx, "get_last")
+    return lambda: database.get_last_record("bench-owner")
+
+
+# ---------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------
+def time_callable(fn, rounds=7, min_round_s=0.05):
+    """Median seconds per call over `rounds` rounds of auto-sized length."""
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_round_s or number >= 1 << 16:
+            break
+        number *= 2
+
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number)
+    return float(np.median(per_call)), number
+
+
+@contextlib.contextmanager
+def _silenced(quiet):
+    if not quiet:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_suite(only=None, rounds=7):
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="microbench-")
+    try:
+        ctx = Context(workdir)
+        for name, setup, quiet in BENCHMARKS:
+            if only and not any(o in name for o in only):
+                continue
+            try:
+                with _silenced(quiet):
+                    fn = setup(ctx)
+            except Exception as e:
+                print(f"{name:<24} skipped ({e})")
+                continue
+            with _silenced(quiet):
+                median, number = time_callable(fn, rounds=rounds)
+            results[name] = {"median_us": round(median * 1e6, 3), "calls_per_round": number}
+    finally:
+        if "database" in sys.modules:
+            sys.modules["database"].close_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each benchmark against the baseline; return the regressed names."""
+    regressed = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<24} {r['median_us']:12.2f} us   (no baseline)")
+            continue
+        ratio = r["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        status = "ok"
+        if ratio > 1.0 + tolerance:
+            status = "REGRESSED"
+            regressed.append(name)
+        print(f"{name:<24} {r['median_us']:12.2f} us   baseline {base['median_us']:12.2f} us"
+              f"   x{ratio:5.2f}  {status}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks with regression thresholds")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--only", nargs="*", help="Run benchmarks whose name contains any of these")
+    parser.add_argument("--report", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_suite(only=args.only, rounds=args.rounds)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+        for name, r in results.items():
+            print(f"{name:<24} {r['median_us']:12.2f} us")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        compare(results, {}, args.tolerance)
+        print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressed = compare(results, baseline, args.tolerance)
+    if regressed:
+        print(f"{len(regressed)} benchmark(s) regressed beyond {args.tolerance:.0%}: "
+              + ", ".join(regressed))
+        return 1
+    print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap "did anything move?" check in front of the detector.
+
+    Each frame is shrunk to a small grey thumbnail, blurred, and compared
+    with the thumbnail of the last frame that went through inference.
+    When fewer than `area_thresh` of the pixels changed by more than
+    `pixel_thresh` grey levels, the scene is static and inference can be
+    skipped. A forced inference every `max_skip` frames keeps slowly
+    drifting shrimp from being missed.
+
+    Sensitivity: lower pixel_thresh / area_thresh -> more frames inferred.
+    """
+
+    def __init__(self, pixel_thresh=12, area_thresh=0.002, size=(80, 60), max_skip=15):
+        self.pixel_thresh = pixel_thresh
+        self.area_thresh = area_thresh
+        self.size = size
+        self.max_skip = max_skip
+
+        self.inferred = 0
+        self.skipped = 0
+        self.last_motion = 0.0      # changed-pixel fraction of the last frame
+        self._reference = None
+        self._since_inference = 0
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_infer(self, frame):
+        """True when `frame` differs enough from the last inferred frame."""
+        thumb = self._thumbnail(frame)
+        if self._reference is None or self._reference.shape != thumb.shape:
+            motion = 1.0
+        else:
+            diff = cv2.absdiff(thumb, self._reference)
+            motion = float(np.count_nonzero(diff > self.pixel_thresh)) / diff.size
+        self.last_motion = motion
+
+        if motion >= self.area_thresh or self._since_inference >= self.max_skip:
+            self._reference = thumb
+            self._since_inference = 0
+            self.inferred += 1
+            return True
+
+        self._since_inference += 1
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        self._reference = None
+        self._since_inference = 0
+
+    def stats(self):
+        total = self.inferred + self.skipped
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / total, 3) if total else 0.0,
+            "last_motion": round(self.last_motion, 4),
+        }
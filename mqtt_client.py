@@ -1,6 +1,8 @@
 import paho.mqtt.client as mqtt
 import ssl
 
+import metrics
+
 # --- NEW: HiveMQ Cloud Credentials ---
 BROKER_ADDRESS = "e498150171fd4c8abc39c1d9f4e8c283.s1.eu.hivemq.cloud"
 BROKER_PORT = 8883
@@ -18,15 +20,35 @@ class MqttClient:
         # ---
         
         self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
         self.connected = False
+        self.handlers = {}  # topic -> callable(payload str), run on paho's thread
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             print("MQTT: Python client connected successfully to HiveMQ.")
             self.connected = True
+            # (Re)subscribe after every connect, the broker forgets on reconnect
+            for topic in self.handlers:
+                self.client.subscribe(topic)
         else:
             print(f"MQTT: Python client failed to connect, code {rc}")
 
+    def on_message(self, client, userdata, msg):
+        handler = self.handlers.get(msg.topic)
+        if handler is None:
+            return
+        try:
+            handler(msg.payload.decode(errors="replace"))
+        except Exception as e:
+            print(f"MQTT: Handler for {msg.topic} failed: {e}")
+
+    def subscribe(self, topic, handler):
+        """Call `handler(payload)` for each message on `topic`."""
+        self.handlers[topic] = handler
+        if self.connected:
+            self.client.subscribe(topic)
+
     def connect(self):
         try:
             # --- NEW: Connect to cloud port ---
@@ -42,6 +64,8 @@ class MqttClient:
 
     def publish(self, topic, payload):
         if self.connected:
-            self.client.publish(topic, payload)
+            with metrics.timed("mqtt_publish"):
+                self.client.publish(topic, payload)
         else:
+            metrics.inc("mqtt_publish_failed")
             print(f"MQTT: Not connected. Cannot publish to {topic}")
\ No newline at end of file
@@ -0,0 +1,309 @@
+import queue, threading, time
+from collections import namedtuple
+from PyQt5 import QtCore
+from compute import compute_feed
+import metrics
+
+# One fully processed frame, as delivered to the GUI. With draw_frames=False
+# `frame` is left undrawn and `overlay` carries the detector Overlay instead.
+PipelineResult = namedtuple(
+    "PipelineResult",
+    ["frame", "total_count", "frame_count", "feed", "seq", "timestamp", "latency_ms",
+     "overlay"],
+)
+
+
+class StageStats:
+    """Throughput and per-item time for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.rate = 0.0
+
+    def record(self, elapsed):
+        with self._lock:
+            self.processed += 1
+            self._window_count += 1
+            self.busy_time += elapsed
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self):
+        """Return the stage figures and roll the throughput window."""
+        with self._lock:
+            now = time.monotonic()
+            span = now - self._window_start
+            if span > 0:
+                self.rate = self._window_count / span
+            self._window_start = now
+            self._window_count = 0
+            avg_ms = (self.busy_time / self.processed * 1000) if self.processed else 0.0
+            return {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "rate": self.rate,
+                "avg_ms": avg_ms,
+            }
+
+
+class DetectionPipeline(QtCore.QObject):
+    """
+    capture -> infer -> track -> render, each stage on its own thread.
+
+    Stages are joined by bounded queues. Capture always hands the newest
+    frame to inference (older queued frames are dropped), the later stages
+    apply back-pressure so the tracker sees every inferred frame in order.
+    Results reach the GUI through `result_ready`; `stats_updated` reports
+    each stage's throughput and queue depth once per `stats_interval_ms`.
+    """
+
+    result_ready = QtCore.pyqtSignal(object)
+    stats_updated = QtCore.pyqtSignal(dict)
+
+    STAGES = ("capture", "infer", "track", "render")
+
+    def __init__(self, camera, detector, queue_size=2, max_pending_results=2,
+                 stats_interval_ms=1000, infer_every=1, draw_frames=True, parent=None):
+        super().__init__(parent)
+        self.camera = camera
+        self.detector = detector
+        self.queue_size = queue_size
+        self.max_pending_results = max_pending_results
+        # Only every Nth camera frame is inferred; the tracker predicts
+        # across the skipped ones
+        self.infer_every = max(1, infer_every)
+        # False when the GUI paints the overlay itself (live display mode)
+        self.draw_frames = draw_frames
+
+        self.queues = {}
+        self.stats = {}
+        self._threads = []
+        self._running = threading.Event()
+        self._pending_results = 0
+        self._pending_lock = threading.Lock()
+
+        # Runs in the GUI thread once the queued signal is delivered
+        self.result_ready.connect(self._on_result_delivered)
+
+        self._stats_timer = QtCore.QTimer(self)
+        self._stats_timer.setInterval(stats_interval_ms)
+        self._stats_timer.timeout.connect(self._emit_stats)
+
+    # ---------------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------------
+    def start(self):
+        if self._running.is_set():
+            return
+        self.queues = {
+            "infer": queue.Queue(maxsize=self.queue_size),
+            "track": queue.Queue(maxsize=self.queue_size),
+            "render": queue.Queue(maxsize=self.queue_size),
+        }
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self._pending_results = 0
+        self._running.set()
+
+        targets = {
+            "capture": self._capture_loop,
+            "infer": self._infer_loop,
+            "track": self._track_loop,
+            "render": self._render_loop,
+        }
+        self._threads = [
+            threading.Thread(target=fn, name=f"Pipeline-{name}", daemon=True)
+            for name, fn in targets.items()
+        ]
+        for t in self._threads:
+            t.start()
+        self._stats_timer.start()
+
+    def stop(self):
+        if not self._running.is_set():
+            return
+        self._running.clear()
+        self._stats_timer.stop()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        self._threads = []
+
+    def is_running(self):
+        return self._running.is_set()
+
+    # ---------------------------------------------------------------
+    # Queue helpers
+    # ---------------------------------------------------------------
+    def _put(self, name, item):
+        """Blocking put that gives up when the pipeline stops."""
+        q = self.queues[name]
+        while self._running.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put_latest(self, name, item, stats):
+        """Non-blocking put that replaces the oldest item when full."""
+        q = self.queues[name]
+        while True:
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    stats.drop()
+                    metrics.inc("pipeline_dropped")
+                except queue.Empty:
+                    pass
+
+    def _get(self, name):
+        try:
+            return self.queues[name].get(timeout=0.1)
+        except queue.Empty:
+            return None
+
+    # ---------------------------------------------------------------
+    # Stages
+    # ---------------------------------------------------------------
+    def _capture_loop(self):
+        stats = self.stats["capture"]
+        seq = 0
+        forwarded_seq = -self.infer_every
+        while self._running.is_set():
+            start = time.monotonic()
+            if getattr(self.camera, "threaded", False):
+                captured = self.camera.get_latest(wait=True, timeout=0.1)
+                if captured is None or captured.seq <= seq:
+                    continue
+                frame, timestamp, seq = captured
+            else:
+                frame = self.camera.get_frame()
+                if frame is None:
+                    time.sleep(0.01)
+                    continue
+                timestamp = time.monotonic()
+                seq += 1
+            elapsed = time.monotonic() - start
+            stats.record(elapsed)
+            metrics.observe("capture_wait", elapsed * 1000)
+            if seq - forwarded_seq < self.infer_every:
+                continue
+            forwarded_seq = seq
+            self._put_latest("infer", (frame, timestamp, seq), stats)
+
+    def _infer_loop(self):
+        stats = self.stats["infer"]
+        while self._running.is_set():
+            item = self._get("infer")
+            if item is None:
+                continue
+            frame, timestamp, seq = item
+            start = time.monotonic()
+            inferred, skipped = self.detector.gated_infer(frame)
+            stats.record(time.monotonic() - start)
+            self._put("track", (frame, timestamp, seq, inferred, skipped))
+
+    def _track_loop(self):
+        stats = self.stats["track"]
+        last_seq = None
+        while self._running.is_set():
+            item = self._get("track")
+            if item is None:
+                continue
+            frame, timestamp, seq, inferred, skipped = item
+
+            # Camera frames elapsed since the last tracked frame
+            dt = seq - last_seq if last_seq is not None else 1
+            last_seq = seq
+
+            start = time.monotonic()
+            self.detector.update_tracks(inferred, skipped, dt=dt)
+            snapshot = self.detector.track_snapshot()
+            stats.record(time.monotonic() - start)
+            self._put("render", (frame, timestamp, seq, inferred, snapshot))
+
+    def _render_loop(self):
+        stats = self.stats["render"]
+        while self._running.is_set():
+            item = self._get("render")
+            if item is None:
+                continue
+            frame, timestamp, seq, inferred, snapshot = item
+
+            # Don't pile up frames the GUI has not painted yet
+            with self._pending_lock:
+                if self._pending_results >= self.max_pending_results:
+                    stats.drop()
+                    metrics.inc("pipeline_dropped")
+                    continue
+                self._pending_results += 1
+
+            start = time.monotonic()
+            detections, scale, pad_x, pad_y, inference_time = inferred
+            overlay = None
+            if self.draw_frames:
+                # The captured frame is owned by the pipeline: draw on it directly
+                frame = self.detector.draw(frame, detections, scale, pad_x, pad_y,
+                                           inference_time, snapshot=snapshot, in_place=True)
+            else:
+                h, w = frame.shape[:2]
+                with metrics.timed("draw"):
+                    overlay = self.detector.overlay_items(detections, scale, pad_x, pad_y,
+                                                          inference_time, w, h, snapshot=snapshot)
+            total_count = snapshot[2]
+            result = PipelineResult(
+                frame=frame,
+                total_count=total_count,
+                frame_count=len(detections),
+                feed=compute_feed(total_count),
+                seq=seq,
+                timestamp=timestamp,
+                latency_ms=(time.monotonic() - timestamp) * 1000,
+                overlay=overlay,
+            )
+            stats.record(time.monotonic() - start)
+            self.result_ready.emit(result)
+
+    # ---------------------------------------------------------------
+    # GUI-thread slots
+    # ---------------------------------------------------------------
+    def _on_result_delivered(self, result):
+        with self._pending_lock:
+            self._pending_results = max(0, self._pending_results - 1)
+        metrics.observe("frame_latency", (time.monotonic() - result.timestamp) * 1000)
+
+    def _emit_stats(self):
+        report = {}
+        for name in self.STAGES:
+            report[name] = self.stats[name].snapshot()
+            q = self.queues.get(name)
+            report[name]["queue"] = q.qsize() if q is not None else 0
+        if hasattr(self.camera, "dropped_frames"):
+            report["capture"]["camera_dropped"] = self.camera.dropped_frames
+        if self.detector.motion_gate is not None:
+            report["infer"]["motion_gate"] = self.detector.motion_gate.stats()
+        self.stats_updated.emit(report)
+
+    @staticmethod
+    def format_stats(report):
+        """One-line summary for a status label."""
+        parts = []
+        for name in DetectionPipeline.STAGES:
+            s = report.get(name)
+            if s is None:
+                continue
+            parts.append(f"{name} {s['rate']:.1f}/s q{s['queue']}")
+            if "motion_gate" in s:
+                parts.append(f"idle-skipped {s['motion_gate']['skipped']}")
+        return " | ".join(parts)
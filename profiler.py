@@ -0,0 +1,185 @@
+"""
+On-demand statistical profiler for the running app.
+
+While it runs, a daemon thread samples the stack of every Python thread
+(GUI, pipeline stages, camera capture, paho's MQTT loop, ...) through
+sys._current_frames() every `interval_s`, for at most `duration_s`. When
+it stops it writes two files to SHRIMP_PROFILE_DIR (default "profiles"):
+
+    profile-<time>.collapsed   one "thread;outer;...;inner count" line per
+                               distinct stack, for flamegraph.pl/speedscope
+    profile-<time>.txt         samples per thread and the top-N functions
+                               by self and by total time
+
+When it is off nothing runs at all. Triggers, all toggling start/stop:
+
+    kill -USR1 <pid>                         install_signal_handler()
+    MQTT "start [seconds]" / "stop" on       attach_mqtt()
+      shrimp/app/profile (status is published on shrimp/app/profile/status)
+    hold the Biomass screen title for 2 s    ui_biomass.BiomassWindow
+
+Native code holding the GIL (e.g. ONNX Runtime inside session.run) is
+attributed to the Python frame that called it.
+"""
+import os, signal, sys, threading, time
+from collections import Counter
+
+PROFILE_DIR = os.environ.get("SHRIMP_PROFILE_DIR", "profiles")
+MQTT_TOPIC = "shrimp/app/profile"
+
+
+class SamplingProfiler:
+    def __init__(self, interval_s=0.005, duration_s=30.0, output_dir=None, top_n=25):
+        self.interval_s = interval_s
+        self.duration_s = duration_s
+        self.output_dir = output_dir or PROFILE_DIR
+        self.top_n = top_n
+        self.on_finished = None         # callable(paths) after each profile is written
+        self.last_paths = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration_s=None):
+        """Start sampling for `duration_s` seconds. Returns False if already running."""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._stop.clear()
+            duration = duration_s or self.duration_s
+            self._thread = threading.Thread(target=self._run, args=(duration,),
+                                            name="SamplingProfiler", daemon=True)
+            self._thread.start()
+        print(f"Profiler: sampling all threads for up to {duration:g} s")
+        return True
+
+    def stop(self):
+        """End the current profile early; it is still written."""
+        self._stop.set()
+
+    def toggle(self, duration_s=None):
+        if self.is_running():
+            self.stop()
+        else:
+            self.start(duration_s)
+
+    # ---------------------------------------------------------------
+    # Sampling
+    # ---------------------------------------------------------------
+    def _run(self, duration):
+        own = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stacks[(names.get(ident, f"thread-{ident}"), self._stack(frame))] += 1
+            samples += 1
+            self._stop.wait(self.interval_s)
+        elapsed = time.monotonic() - started
+
+        try:
+            paths = self.write(stacks, samples, elapsed)
+        except OSError as e:
+            print(f"Profiler: could not write profile: {e}")
+            return
+        self.last_paths = paths
+        print(f"Profiler: {samples} samples in {elapsed:.1f} s -> {paths[0]}")
+        if self.on_finished is not None:
+            self.on_finished(paths)
+
+    @staticmethod
+    def _stack(frame):
+        """Outermost-first tuple of "function (file:line)" for one thread."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    # ---------------------------------------------------------------
+    # Output
+    # ---------------------------------------------------------------
+    def write(self, stacks, samples, elapsed):
+        """Write the .collapsed and .txt files; returns their paths."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        collapsed, summary = f"{base}.collapsed", f"{base}.txt"
+
+        with open(collapsed, "w") as f:
+            for (thread, stack), n in stacks.most_common():
+                f.write(";".join((thread.replace(" ", "_"),) + stack) + f" {n}\n")
+        with open(summary, "w") as f:
+            f.write(self.summarize(stacks, samples, elapsed))
+        return collapsed, summary
+
+    def summarize(self, stacks, samples, elapsed):
+        """Per-thread sample counts and the top-N functions by self and total samples."""
+        per_thread, self_time, total_time = Counter(), Counter(), Counter()
+        for (thread, stack), n in stacks.items():
+            per_thread[thread] += n
+            if stack:
+                self_time[stack[-1]] += n
+            for func in set(stack):
+                total_time[func] += n
+
+        lines = [f"{samples} samples over {elapsed:.1f} s "
+                 f"(every {self.interval_s * 1000:g} ms)", "", "Samples per thread:"]
+        for thread, n in per_thread.most_common():
+            lines.append(f"  {n:8d} {100.0 * n / max(samples, 1):6.1f}%  {thread}")
+        for title, counts in (("self", self_time), ("total", total_time)):
+            lines += ["", f"Top {self.top_n} by {title} samples:"]
+            for func, n in counts.most_common(self.top_n):
+                lines.append(f"  {n:8d} {100.0 * n / max(samples, 1):6.1f}%  {func}")
+        return "\n".join(lines) + "\n"
+
+
+PROFILER = SamplingProfiler()
+
+
+# ---------------------------------------------------------------
+# Triggers
+# ---------------------------------------------------------------
+def install_signal_handler(sig=getattr(signal, "SIGUSR1", None), profiler=PROFILER):
+    """Toggle `profiler` on `sig` (SIGUSR1). Call from the main thread."""
+    if sig is None:
+        return False
+    signal.signal(sig, lambda signum, frame: profiler.toggle())
+    return True
+
+
+def attach_mqtt(mqtt_client, topic=MQTT_TOPIC, profiler=PROFILER):
+    """
+    Control `profiler` from MQTT: "start [seconds]", "stop" or "toggle" on
+    `topic`; progress and the written file names go to `topic`/status.
+    """
+    def on_command(payload):
+        words = payload.strip().split()
+        command = words[0].lower() if words else "toggle"
+        try:
+            duration = float(words[1]) if len(words) > 1 else None
+        except ValueError:
+            mqtt_client.publish(f"{topic}/status", f"bad duration '{words[1]}'")
+            return
+        if command == "start":
+            started = profiler.start(duration)
+            mqtt_client.publish(f"{topic}/status", "started" if started else "already running")
+        elif command == "stop":
+            profiler.stop()
+        elif command == "toggle":
+            profiler.toggle(duration)
+        else:
+            mqtt_client.publish(f"{topic}/status", f"unknown command '{command}'")
+
+    profiler.on_finished = lambda paths: mqtt_client.publish(
+        f"{topic}/status", "written " + " ".join(paths))
+    mqtt_client.subscribe(topic, on_command)
@@ -0,0 +1,230 @@
+"""
+INT8 static quantization for the shrimp detector.
+
+Calibrates on frames captured from the tanks (any folder of .jpg/.png
+stills, or a single image such as test.jpeg), writes a QDQ INT8 model
+that ShrimpDetector(precision="int8") loads, then replays the same frames
+through both models and reports latency and detection agreement.
+
+    python quantize.py --frames captures/ --report quant_report.json
+    python quantize.py --frames captures/ --compare-only
+"""
+import argparse, json, os, time
+import cv2
+import numpy as np
+
+from detector import ShrimpDetector, box_iou, quantized_model_path
+from frame_sources import list_frames
+
+
+# ---------------------------------------------------------------
+# Frame loading
+# ---------------------------------------------------------------
+def load_frames(files):
+    frames = []
+    for f in files:
+        img = cv2.imread(f)
+        if img is None:
+            print(f"Skipping unreadable frame: {f}")
+            continue
+        frames.append(img)
+    return frames
+
+
+# ---------------------------------------------------------------
+# Calibration
+# ---------------------------------------------------------------
+def make_calibration_reader(detector, frames):
+    """CalibrationDataReader feeding letterboxed frames exactly as at runtime."""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter(frames)
+
+        def get_next(self):
+            frame = next(self._iter, None)
+            if frame is None:
+                return None
+            # Copy: the detector reuses its input tensor between frames
+            tensor = detector.preprocess(frame)[0].copy()
+            return {detector.input_name: tensor}
+
+        def rewind(self):
+            self._iter = iter(frames)
+
+    return FrameCalibrationReader()
+
+
+def quantize_model(model_path, output_path, detector, frames, per_channel=True,
+                   method="minmax"):
+    """Run static INT8 calibration on `frames` and write `output_path`."""
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+
+    # Shape inference + graph cleanup makes more nodes quantizable
+    source = model_path
+    prep_path = os.path.splitext(output_path)[0] + ".prep.onnx"
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(model_path, prep_path, skip_symbolic_shape=True)
+        source = prep_path
+    except Exception as e:
+        print(f"Quantization pre-processing skipped: {e}")
+
+    try:
+        quantize_static(
+            source,
+            output_path,
+            make_calibration_reader(detector, frames),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            calibrate_method=methods[method],
+        )
+    finally:
+        if source == prep_path and os.path.exists(prep_path):
+            os.remove(prep_path)
+    print(f"Wrote INT8 model: {output_path}")
+
+
+# ---------------------------------------------------------------
+# FP32 vs INT8 comparison
+# ---------------------------------------------------------------
+def match_detections(ref, test, iou_thresh=0.5):
+    """Greedy IoU matching of `test` boxes against `ref`. Returns (matches, ious)."""
+    if len(ref) == 0 or len(test) == 0:
+        return 0, []
+    iou = box_iou(ref, test)
+    ious = []
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_thresh:
+            break
+        ious.append(float(iou[i, j]))
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return len(ious), ious
+
+
+def _latency_summary(latencies):
+    arr = np.asarray(latencies, dtype=np.float64)
+    if arr.size == 0:
+        return {}
+    return {
+        "mean_ms": round(float(arr.mean()), 2),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+    }
+
+
+def compare_models(fp32, int8, frames, warmup=3, iou_thresh=0.5):
+    """Replay `frames` through both detectors and summarise the differences."""
+    for frame in frames[:warmup]:
+        fp32.infer(frame)
+        int8.infer(frame)
+
+    lat_fp32, lat_int8 = [], []
+    n_ref = n_test = n_matched = 0
+    all_ious = []
+    count_diffs = []
+    for frame in frames:
+        ref, *_, t_ref = fp32.infer(frame)
+        test, *_, t_test = int8.infer(frame)
+        lat_fp32.append(t_ref)
+        lat_int8.append(t_test)
+
+        matched, ious = match_detections(ref, test, iou_thresh)
+        n_ref += len(ref)
+        n_test += len(test)
+        n_matched += matched
+        all_ious.extend(ious)
+        count_diffs.append(len(test) - len(ref))
+
+    precision = n_matched / n_test if n_test else 1.0
+    recall = n_matched / n_ref if n_ref else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) else 0.0
+    fp32_lat = _latency_summary(lat_fp32)
+    int8_lat = _latency_summary(lat_int8)
+    speedup = (fp32_lat["mean_ms"] / int8_lat["mean_ms"]
+               if frames and int8_lat["mean_ms"] > 0 else None)
+
+    return {
+        "frames": len(frames),
+        "fp32": {"model": fp32.model_path, "detections": n_ref, **fp32_lat},
+        "int8": {"model": int8.model_path, "detections": n_test, **int8_lat},
+        "speedup": round(speedup, 2) if speedup else None,
+        "agreement": {
+            "iou_thresh": iou_thresh,
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(f1, 4),
+            "mean_iou": round(float(np.mean(all_ious)), 4) if all_ious else None,
+            "mean_abs_count_diff": round(float(np.mean(np.abs(count_diffs))), 3) if count_diffs else 0.0,
+        },
+    }
+
+
+def print_report(report):
+    fp, q, agr = report["fp32"], report["int8"], report["agreement"]
+    print(f"Frames compared: {report['frames']}")
+    print(f"FP32  mean {fp.get('mean_ms')} ms | p95 {fp.get('p95_ms')} ms | {fp['detections']} boxes")
+    print(f"INT8  mean {q.get('mean_ms')} ms | p95 {q.get('p95_ms')} ms | {q['detections']} boxes")
+    print(f"Speedup: {report['speedup']}x")
+    print(f"Agreement vs FP32: P={agr['precision']} R={agr['recall']} F1={agr['f1']} "
+          f"mean IoU={agr['mean_iou']} | count diff/frame={agr['mean_abs_count_diff']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 static quantization for YOLOshrimp")
+    parser.add_argument("--frames", required=True, help="Folder of captured frames or a single image")
+    parser.add_argument("--model", default="models/YOLOshrimp.onnx", help="FP32 ONNX model")
+    parser.add_argument("--output", default=None, help="INT8 model path (default: <model>.int8.onnx)")
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--max-frames", type=int, default=200, help="Calibration/comparison frame cap")
+    parser.add_argument("--method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--per-tensor", action="store_true", help="Per-tensor instead of per-channel weights")
+    parser.add_argument("--compare-only", action="store_true", help="Skip calibration, only compare")
+    parser.add_argument("--report", default=None, help="Write the comparison report as JSON")
+    args = parser.parse_args()
+
+    output = args.output or quantized_model_path(args.model)
+    frames = load_frames(list_frames(args.frames, args.max_frames))
+    if not frames:
+        print(f"No frames found in {args.frames}")
+        return 1
+
+    fp32 = ShrimpDetector(args.model, imgsz=args.imgsz, cache_optimized=False)
+    if fp32.session is None:
+        return 1
+
+    if not args.compare_only:
+        print(f"Calibrating on {len(frames)} frame(s)...")
+        start = time.time()
+        quantize_model(args.model, output, fp32, frames,
+                       per_channel=not args.per_tensor, method=args.method)
+        print(f"Calibration took {time.time() - start:.1f}s")
+
+    int8 = ShrimpDetector(output, imgsz=args.imgsz, cache_optimized=False)
+    if int8.session is None:
+        return 1
+
+    report = compare_models(fp32, int8, frames)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
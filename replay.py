@@ -0,0 +1,212 @@
+"""
+End-to-end replay benchmark for the counting pipeline.
+
+Replays a video file, a folder of frames, a single image (test.jpeg works
+as a smoke input), a raw recording or a synthetic scene through
+ShrimpDetector exactly as the app does: gated inference, tracking and
+drawing. Reports per-stage timings, p50/p95/p99 latency, FPS and the
+final total_count as JSON for diffing between runs and machines.
+
+    python replay.py --source captures/run1.mp4 --report replay.json
+    python replay.py --source test.jpeg --loop 200
+"""
+import argparse, itertools, json, os, platform, time
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from detector import ShrimpDetector
+from frame_sources import open_source
+
+STAGES = ("preprocess", "inference", "decode", "track", "draw", "total")
+
+
+# ---------------------------------------------------------------
+# Frame loading
+# ---------------------------------------------------------------
+def iter_frames(source, loop=1, max_frames=None):
+    """
+    Yield BGR frames from a frame_sources spec: a video file, an image
+    folder or single image, a .raw recording or "synthetic[:N]".
+
+    Frames arrive as fast as they are consumed (no realtime pacing).
+    """
+    n = 0
+    for _ in range(max(1, loop)):
+        src = open_source(source, realtime=False)
+        try:
+            for captured in src:
+                if max_frames and n >= max_frames:
+                    return
+                n += 1
+                yield captured.image
+        finally:
+            src.release()
+
+
+# ---------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------
+def summarize(values):
+    """mean/p50/p95/p99/max of a list of millisecond timings."""
+    arr = np.asarray(values, dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": ort.__version__,
+    }
+
+
+# ---------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------
+def replay(detector, frames, warmup=5, draw=True):
+    """
+    Run `frames` through `detector` and return the timing report.
+
+    The detector starts from a zero count (the saved count file is left
+    alone). Warmup infers a copy of the first frame `warmup` times, so
+    every frame of the source is still replayed and timed.
+    """
+    timings = {name: [] for name in STAGES}
+    skipped = detections = n = 0
+
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is not None:
+        for _ in range(warmup):
+            detector.infer(first.copy())
+        frames = itertools.chain([first], frames)
+    detector.tracker.reset()
+    detector.total_count = 0
+    detector._last_inferred = None
+    if detector.motion_gate is not None:
+        detector.motion_gate.reset()
+
+    wall_start = time.perf_counter()
+    for frame in frames:
+        n += 1
+        t0 = time.perf_counter()
+        inferred, was_skipped = detector.gated_infer(frame)
+        t1 = time.perf_counter()
+        detector.update_tracks(inferred, was_skipped)
+        t2 = time.perf_counter()
+        if draw:
+            dets, scale, pad_x, pad_y, inference_time = inferred
+            detector.draw(frame, dets, scale, pad_x, pad_y, inference_time, in_place=True)
+        t3 = time.perf_counter()
+
+        if was_skipped:
+            skipped += 1
+        else:
+            for name in ("preprocess", "inference", "decode"):
+                if name in detector.last_timings:
+                    timings[name].append(detector.last_timings[name])
+            detections += len(inferred[0])
+        timings["track"].append((t2 - t1) * 1000)
+        if draw:
+            timings["draw"].append((t3 - t2) * 1000)
+        timings["total"].append((t3 - t0) * 1000)
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "frames": n,
+        "inferred": n - skipped,
+        "skipped": skipped,
+        "detections": detections,
+        "total_count": detector.total_count,
+        "wall_s": round(wall, 3),
+        "fps": round(n / wall, 2) if wall > 0 else None,
+        "stages": {name: summarize(values) for name, values in timings.items()},
+    }
+
+
+def print_report(report):
+    r = report["result"]
+    print(f"Frames: {r['frames']} (inferred {r['inferred']}, skipped {r['skipped']}) "
+          f"| {r['fps']} FPS | total_count {r['total_count']}")
+    for name in STAGES:
+        s = r["stages"][name]
+        if s["count"]:
+            print(f"  {name:<10} mean {s['mean_ms']:8.2f} | p50 {s['p50_ms']:8.2f} | "
+                  f"p95 {s['p95_ms']:8.2f} | p99 {s['p99_ms']:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay benchmark for the shrimp counter")
+    parser.add_argument("--source", default="test.jpeg",
+                        help="Video file, frame folder, single image, .raw recording or synthetic[:N]")
+    parser.add_argument("--model", default="models/YOLOshrimp.onnx")
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--profile", default="latency")
+    parser.add_argument("--precision", choices=["fp32", "int8"], default="fp32")
+    parser.add_argument("--loop", type=int, default=1, help="Replay the source N times")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--motion-gating", action="store_true")
+    parser.add_argument("--roi", action="store_true", help="Counting-band ROI inference")
+    parser.add_argument("--tiled", action="store_true", help="Tiled inference")
+    parser.add_argument("--no-draw", action="store_true", help="Skip the draw stage")
+    parser.add_argument("--report", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    detector = ShrimpDetector(
+        args.model, imgsz=args.imgsz, profile=args.profile, precision=args.precision,
+        motion_gating=args.motion_gating, roi_mode=args.roi, tiled=args.tiled,
+    )
+    if detector.session is None:
+        return 1
+
+    max_frames = args.max_frames
+    if max_frames is None and args.source.startswith("synthetic"):
+        max_frames = 300    # synthetic scenes never end on their own
+    frames = iter_frames(args.source, loop=args.loop, max_frames=max_frames)
+    result = replay(detector, frames, warmup=args.warmup, draw=not args.no_draw)
+    if result["frames"] == 0:
+        print(f"No frames replayed from {args.source}")
+        return 1
+
+    report = {
+        "source": args.source,
+        "model": detector.model_path,
+        "settings": {
+            "imgsz": args.imgsz,
+            "profile": args.profile,
+            "precision": args.precision,
+            "motion_gating": args.motion_gating,
+            "roi": args.roi,
+            "tiled": args.tiled,
+            "loop": args.loop,
+            "warmup": args.warmup,
+        },
+        "machine": machine_info(),
+        "result": result,
+    }
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,13 @@ export QT_QPA_PLATFORM="Wayland"
 export QT_AUTO_SCREEN_SCALE_FACTOR=0
 export QT_SCALE_FACTOR=1
 export QT_FONT_DPI=96
+# Replay a recording or synthetic scene instead of the camera (see frame_sources.py)
+# export SHRIMP_FRAME_SOURCE="captures/run1.raw"
+# Per-stage latency metrics (see metrics.py): Prometheus text on a local
+# port and/or a textfile, and the on-screen table shown at start
+# export SHRIMP_METRICS_PORT=9108
+# export SHRIMP_METRICS_FILE="/var/lib/node_exporter/textfile/shrimp.prom"
+# export SHRIMP_DIAGNOSTICS=1
 
 # --- Move to project folder ---
 cd /home/hiponpd/Documents/GitHub/ShrimpMachineApp
@@ -0,0 +1,242 @@
+"""
+Synthetic shrimp scenes with ground-truth line crossings.
+
+SyntheticScene moves a population of shrimp across a top-down frame and
+produces either detector-style boxes (with misses, merged overlaps, jitter
+and false positives) or rendered BGR frames. Every shrimp is counted once,
+on its first left-to-right crossing of `line_x`, which is exactly the rule
+the tracker applies, so the tracker's total can be scored against it.
+
+The CLI sweeps densities through ShrimpDetector._update_tracker and
+reports tracker time and counting accuracy:
+
+    python scene_sim.py --counts 10 50 100 250 500 --frames 300
+    python scene_sim.py --counts 200 --speed 25 --occlusion 0.1 --clumping 0.5
+"""
+import argparse, contextlib, io, json, time
+import cv2
+import numpy as np
+
+from detector import ShrimpDetector, box_iou
+
+
+class SyntheticScene:
+    """
+    `count` shrimp kept in frame: one that leaves is respawned on the
+    upstream edge.
+
+    speed            mean px/frame along `direction` (degrees, 0 = left to right)
+    speed_jitter     per-shrimp speed spread, as a fraction of `speed`
+    wander           px/frame std of the cross-flow random walk
+    clumping         fraction of respawns placed next to an existing shrimp
+    occlusion        chance a shrimp is missed by the detector on a frame;
+                     shrimp overlapping by more than `merge_iou` also merge
+                     into one detection
+    noise            px std of detection box jitter
+    false_positives  mean spurious detections per frame
+    """
+
+    def __init__(self, count=50, width=640, height=480, speed=4.0, speed_jitter=0.25,
+                 direction=0.0, wander=0.3, clumping=0.0, occlusion=0.0, merge_iou=0.3,
+                 noise=0.0, false_positives=0.0, size=(18, 6), line_x=None, seed=0):
+        self.width, self.height = width, height
+        self.speed = speed
+        self.speed_jitter = speed_jitter
+        self.direction = np.deg2rad(direction)
+        self.wander = wander
+        self.clumping = clumping
+        self.occlusion = occlusion
+        self.merge_iou = merge_iou
+        self.noise = noise
+        self.false_positives = false_positives
+        self.size = np.asarray(size, dtype=np.float32)
+        self.line_x = width / 2 if line_x is None else line_x
+        self.rng = np.random.default_rng(seed)
+
+        self.heading = np.array([np.cos(self.direction), np.sin(self.direction)], dtype=np.float32)
+        self.positions = self.rng.uniform((0, 0), (width, height), size=(count, 2)).astype(np.float32)
+        self.velocities = self._new_velocities(count)
+        self.counted = np.zeros(count, dtype=bool)
+        self.frame_index = 0
+        self.gt_crossings = 0
+
+    def _new_velocities(self, n):
+        speeds = self.speed * (1 + self.speed_jitter * self.rng.standard_normal(n))
+        return (np.maximum(speeds, 0.1)[:, None] * self.heading).astype(np.float32)
+
+    def _respawn(self, rows):
+        """Move `rows` back to the upstream edge (or next to a shrimp when clumping)."""
+        n = len(rows)
+        half = self.size.max()
+        pos = np.empty((n, 2), dtype=np.float32)
+        if abs(self.heading[0]) >= abs(self.heading[1]):
+            pos[:, 0] = -half if self.heading[0] > 0 else self.width + half
+            pos[:, 1] = self.rng.uniform(0, self.height, n)
+        else:
+            pos[:, 0] = self.rng.uniform(0, self.width, n)
+            pos[:, 1] = -half if self.heading[1] > 0 else self.height + half
+        self.velocities[rows] = self._new_velocities(n)
+
+        clump = self.rng.random(n) < self.clumping
+        if clump.any():
+            # Join a shrimp still near the entry edge, sharing its velocity
+            upstream = np.argsort((self.positions - pos.mean(axis=0)) @ -self.heading)[:max(1, n)]
+            mates = self.rng.choice(upstream, clump.sum())
+            pos[clump] = self.positions[mates] + self.rng.normal(0, half, (clump.sum(), 2))
+            self.velocities[rows[clump]] = self.velocities[mates]
+        self.positions[rows] = pos
+        self.counted[rows] = False
+
+    def step(self):
+        """Advance one frame. Returns the ground-truth crossings on this frame."""
+        old_x = self.positions[:, 0].copy()
+        self.positions += self.velocities
+        if self.wander:
+            side = np.array([-self.heading[1], self.heading[0]], dtype=np.float32)
+            self.positions += side * self.rng.normal(0, self.wander, (len(self.positions), 1))
+
+        crossed = (old_x < self.line_x) & (self.positions[:, 0] >= self.line_x) & ~self.counted
+        self.counted |= crossed
+        n_crossed = int(crossed.sum())
+        self.gt_crossings += n_crossed
+
+        margin = self.size.max() * 2
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        gone = np.flatnonzero((x < -margin) | (x > self.width + margin)
+                              | (y < -margin) | (y > self.height + margin))
+        if len(gone):
+            self._respawn(gone)
+        self.frame_index += 1
+        return n_crossed
+
+    def true_boxes(self):
+        """(N, 4) boxes of the shrimp currently inside the frame."""
+        half = self.size / 2
+        inside = ((self.positions[:, 0] >= 0) & (self.positions[:, 0] < self.width)
+                  & (self.positions[:, 1] >= 0) & (self.positions[:, 1] < self.height))
+        p = self.positions[inside]
+        return np.hstack([p - half, p + half]).astype(np.float32)
+
+    def detections(self):
+        """What a detector would report on the current frame."""
+        boxes = self.true_boxes()
+        if self.occlusion:
+            boxes = boxes[self.rng.random(len(boxes)) >= self.occlusion]
+        if self.merge_iou and len(boxes) > 1:
+            # Overlapping shrimp show up as a single detection
+            iou = box_iou(boxes, boxes)
+            np.fill_diagonal(iou, 0)
+            hidden = np.triu(iou > self.merge_iou).any(axis=0)
+            boxes = boxes[~hidden]
+        if self.noise:
+            boxes = boxes + self.rng.normal(0, self.noise, boxes.shape).astype(np.float32)
+        n_fp = self.rng.poisson(self.false_positives) if self.false_positives else 0
+        if n_fp:
+            centers = self.rng.uniform((0, 0), (self.width, self.height), (n_fp, 2))
+            half = self.size / 2
+            boxes = np.vstack([boxes, np.hstack([centers - half, centers + half])]).astype(np.float32)
+        return boxes
+
+    def render(self, background=(70, 90, 60)):
+        """Top-down BGR frame of the current shrimp positions."""
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[:] = background
+        frame += self.rng.integers(0, 12, size=(self.height, self.width, 1), dtype=np.uint8)
+        angle = float(np.rad2deg(self.direction))
+        axes = (int(self.size[0] / 2), int(self.size[1] / 2))
+        for x, y in self.positions.astype(np.int32):
+            cv2.ellipse(frame, (int(x), int(y)), axes, angle, 0, 360, (200, 210, 220), -1)
+        return frame
+
+
+# ---------------------------------------------------------------
+# Tracker stress test
+# ---------------------------------------------------------------
+def run_density(count, frames=300, warmup=30, detector_kwargs=None, infer_every=1,
+                **scene_kwargs):
+    """
+    Feed one scene through a tracking-only ShrimpDetector and score it.
+    With infer_every > 1 only every n-th frame is tracked, as when
+    inference runs on every 2nd or 3rd camera frame.
+    """
+    detector = ShrimpDetector(model_path=None, **(detector_kwargs or {}))
+    detector.total_count = 0
+    h, w = scene_kwargs.get("height", 480), scene_kwargs.get("width", 640)
+    scale, _, _, pad_x, pad_y = detector._letterbox_params(h, w)
+    line_x = (detector.counting_line_x - pad_x) / scale
+    scene = SyntheticScene(count=count, line_x=line_x, **scene_kwargs)
+
+    # Let tracks establish before scoring
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup):
+            scene.step()
+            if i % infer_every == 0:
+                detector._update_tracker(scene.detections(), scale, pad_x, pad_y, dt=infer_every)
+    detector.total_count = 0
+    scene.gt_crossings = 0
+
+    times = []
+    max_tracks = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(frames):
+            scene.step()
+            if i % infer_every:
+                continue
+            boxes = scene.detections()
+            start = time.perf_counter()
+            detector._update_tracker(boxes, scale, pad_x, pad_y, dt=infer_every)
+            times.append((time.perf_counter() - start) * 1000)
+            max_tracks = max(max_tracks, len(detector.tracker.ids))
+
+    gt, counted = scene.gt_crossings, detector.total_count
+    arr = np.asarray(times)
+    return {
+        "count": count,
+        "frames": frames,
+        "max_tracks": max_tracks,
+        "update_mean_ms": round(float(arr.mean()), 3),
+        "update_p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "gt_crossings": gt,
+        "counted": counted,
+        "error": counted - gt,
+        "error_pct": round(100.0 * (counted - gt) / gt, 2) if gt else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker density sweep on synthetic scenes")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--speed", type=float, default=4.0)
+    parser.add_argument("--direction", type=float, default=0.0, help="Degrees, 0 = left to right")
+    parser.add_argument("--clumping", type=float, default=0.0)
+    parser.add_argument("--occlusion", type=float, default=0.0)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--false-positives", type=float, default=0.0)
+    parser.add_argument("--tracker-mode", choices=["optimal", "greedy"], default="optimal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default=None, help="Write the sweep as JSON")
+    args = parser.parse_args()
+
+    scene_kwargs = dict(speed=args.speed, direction=args.direction, clumping=args.clumping,
+                        occlusion=args.occlusion, noise=args.noise,
+                        false_positives=args.false_positives, seed=args.seed)
+    results = []
+    print(f"{'count':>6} {'tracks':>7} {'mean ms':>9} {'p95 ms':>8} {'truth':>7} {'counted':>8} {'error %':>8}")
+    for count in args.counts:
+        r = run_density(count, frames=args.frames,
+                        detector_kwargs={"tracker_mode": args.tracker_mode}, **scene_kwargs)
+        results.append(r)
+        print(f"{r['count']:>6} {r['max_tracks']:>7} {r['update_mean_ms']:>9.2f} "
+              f"{r['update_p95_ms']:>8.2f} {r['gt_crossings']:>7} {r['counted']:>8} {r['error_pct']:>8.2f}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"scene": scene_kwargs, "tracker_mode": args.tracker_mode,
+                       "results": results}, f, indent=2)
+        print(f"Saved report to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
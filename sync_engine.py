@@ -0,0 +1,167 @@
+"""
+Background MongoDB sync for the local biomass records.
+
+SyncEngine owns one daemon thread and one MongoClient. It polls the
+(ownerId, synced) index for unsynced rows and walks them in id order,
+SYNC_BATCH_SIZE at a time, as unordered upserts keyed by recordId. So the
+GUI never waits on the network, a weeks-long backlog is never loaded at
+once, and the SQLite write lock is only held for one small UPDATE per
+chunk. Only rows the server acknowledged are marked synced. An
+interrupted pass therefore resumes where it stopped, and resending a row
+whose acknowledgement was lost just overwrites the same document. Rows
+the server rejects are skipped until the next pass.
+
+After a failure, or a pass that left rejected rows behind, it waits an
+exponentially growing, jittered delay (BACKOFF_BASE_S doubling up to
+BACKOFF_MAX_S) before retrying; wake() skips the wait, e.g. right after
+a record is saved or when the operator taps "Sync to Cloud".
+
+State reaches the UI through signals (emitted from the sync thread, so
+connected slots run queued on the GUI thread):
+
+    progress(synced, pending)    after each batch and each poll
+    records_synced(ids)          local ids just marked synced
+    error_changed(message)       last error, "" once a batch succeeds
+    state_changed(state)         "idle", "syncing" or "retrying"
+"""
+import random, threading, time
+from PyQt5 import QtCore
+import database
+import metrics
+
+POLL_INTERVAL_S = 15.0       # check for new unsynced rows this often when idle
+BATCH_PAUSE_S = 0.2          # yield between batches of a large backlog
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 300.0
+
+
+class SyncEngine(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int)
+    records_synced = QtCore.pyqtSignal(list)
+    error_changed = QtCore.pyqtSignal(str)
+    state_changed = QtCore.pyqtSignal(str)
+
+    def __init__(self, owner_id, batch_size=database.SYNC_BATCH_SIZE, parent=None):
+        super().__init__(parent)
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.state = "idle"
+        self.synced = 0              # records pushed since start()
+        self.pending = 0
+        self.last_error = ""
+        self.last_sync_time = None   # wall-clock time of the last successful batch
+        self.failures = 0
+        self._cursor = 0             # last local id sent in the current pass
+        self._pass_errors = []
+        self._client = None
+        self._collection = None
+        self._thread = None
+        self._running = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="SyncEngine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop after the current batch; a batch blocked on the network is left to its daemon thread."""
+        self._running.clear()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Look for unsynced rows now, skipping any poll or backoff wait."""
+        self._wake.set()
+
+    # ---------------------------------------------------------------
+    # Sync thread
+    # ---------------------------------------------------------------
+    def _run(self):
+        while self._running.is_set():
+            try:
+                self.pending = database.count_unsynced(self.owner_id)
+            except Exception as e:
+                self._fail(e)
+                continue
+            self.progress.emit(self.synced, self.pending)
+            if not self.pending:
+                self._set_state("idle")
+                self._wait(POLL_INTERVAL_S)
+                continue
+
+            self._set_state("syncing")
+            try:
+                batch = self._push_batch()
+            except Exception as e:
+                self._fail(e)
+                continue
+
+            if batch.last_id == self._cursor:
+                # End of the pass: what is still pending was rejected on the way
+                errors, self._pass_errors, self._cursor = self._pass_errors, [], 0
+                if errors:
+                    self._fail(RuntimeError(f"{len(errors)} record(s) rejected: {errors[-1]}"))
+                continue
+
+            self._cursor = batch.last_id
+            self._pass_errors += batch.errors
+            ids = batch.synced_ids
+            if ids:
+                self.failures = 0
+                self.synced += len(ids)
+                self.pending = max(self.pending - len(ids), 0)
+                self.last_sync_time = time.time()
+                metrics.inc("sync_records", len(ids))
+                self.records_synced.emit(ids)
+            if not batch.errors:
+                self._set_error("")
+            self.progress.emit(self.synced, self.pending)
+            if self.pending:
+                self._wait(BATCH_PAUSE_S)
+        self._close_client()
+        self._set_state("idle")
+
+    def _push_batch(self):
+        if self._collection is None:
+            self._client, self._collection = database.mongo_collection()
+        with metrics.timed("sync_batch"):
+            return database.push_unsynced(self.owner_id, self._collection, self.batch_size,
+                                          after_id=self._cursor)
+
+    def _fail(self, error):
+        self.failures += 1
+        metrics.inc("sync_failed")
+        self._close_client()     # reconnect from scratch after the backoff
+        delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (self.failures - 1))
+        delay = random.uniform(delay / 2, delay)
+        print(f"Sync: attempt {self.failures} failed ({error}); retrying in {delay:.0f} s")
+        self._set_error(str(error))
+        self._set_state("retrying")
+        self._wait(delay)
+
+    def _wait(self, seconds):
+        self._wake.wait(seconds)
+        self._wake.clear()
+
+    def _close_client(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+        self._client = self._collection = None
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.state_changed.emit(state)
+
+    def _set_error(self, message):
+        if message != self.last_error:
+            self.last_error = message
+            self.error_changed.emit(message)
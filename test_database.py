@@ -0,0 +1,73 @@
+"""Local database and sync tests (python -m pytest)."""
+import sqlite3
+import pytest
+
+pytest.importorskip("bcrypt")
+pytest.importorskip("pymongo")
+import database
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection for push_unsynced."""
+
+    def __init__(self, on_write=None):
+        self.docs = {}
+        self.on_write = on_write
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self.docs[op._filter["recordId"]] = op._doc["$set"]
+        if self.on_write:
+            self.on_write()
+
+    def delete_many(self, query):
+        for record_id in query["recordId"]["$in"]:
+            self.docs.pop(record_id, None)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "local.db"))
+    database.init_db()
+    yield database
+    database.close_connections()
+
+
+def test_migration_rekeys_duplicate_record_ids(tmp_path, monkeypatch):
+    # A database from before recordId was unique, all rows already synced
+    path = str(tmp_path / "local.db")
+    conn = sqlite3.connect(path)
+    for step in database.MIGRATIONS[:2]:
+        step(conn)
+    conn.executemany(
+        "INSERT INTO biomass_records(ownerId, recordId, shrimpCount, synced) VALUES(?,?,?,1)",
+        [("owner", "a", 1), ("owner", "a", 2), ("owner", None, 3), ("owner", "b", 4)])
+    conn.execute("PRAGMA user_version=2")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    try:
+        rows = database.connections().reader().execute(
+            "SELECT shrimpCount, recordId, synced FROM biomass_records ORDER BY id").fetchall()
+    finally:
+        database.close_connections()
+    assert len(rows) == 4
+    assert len({record_id for _, record_id, _ in rows}) == 4
+    assert rows[0][1:] == ("a", 1) and rows[3][1:] == ("b", 1)
+    # Re-keyed rows are new to MongoDB
+    assert [synced for _, _, synced in rows[1:3]] == [0, 0]
+
+
+def test_record_deleted_during_sync_is_not_left_in_mongo(db):
+    for count in range(3):
+        db.save_biomass_record("owner", count, 1.0, 2.0)
+    doomed = db.get_all_records("owner")[0][0]
+    collection = FakeCollection(on_write=lambda: db.delete_record(doomed, "owner"))
+
+    batch = db.push_unsynced("owner", collection)
+    assert doomed not in batch.synced_ids
+    assert len(batch.synced_ids) == 2
+    assert len(collection.docs) == 2
+    assert db.count_unsynced("owner") == 0
@@ -0,0 +1,19 @@
+"""Post-processing tests (python -m pytest)."""
+import numpy as np
+import pytest
+
+from detector import ShrimpDetector, non_max_suppression
+
+
+def test_per_class_nms_keeps_overlapping_boxes_of_other_classes():
+    # Boxes clipped past the top-left border have negative coordinates
+    boxes = np.array([[-40, -40, -2, -2], [-40, -40, -2, -2], [-39, -40, -2, -2]],
+                     dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7])
+    keep = non_max_suppression(boxes, scores, classes=np.array([0, 1, 0]))
+    assert keep.tolist() == [0, 1]
+
+
+def test_int8_without_model_is_rejected():
+    with pytest.raises(ValueError, match="int8"):
+        ShrimpDetector(model_path=None, precision="int8")
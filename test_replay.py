@@ -0,0 +1,30 @@
+"""Replay benchmark smoke tests (python -m pytest)."""
+import json, sys
+import pytest
+
+import replay
+from microbench import make_synthetic_model
+
+
+@pytest.fixture
+def model(tmp_path):
+    pytest.importorskip("onnx")
+    path = str(tmp_path / "synthetic.onnx")
+    make_synthetic_model(path)
+    return path
+
+
+def test_default_invocation_replays_test_image(model, tmp_path, monkeypatch):
+    # Defaults apart from the model, which is not shipped with the repo
+    report = tmp_path / "replay.json"
+    monkeypatch.setattr(sys, "argv", ["replay.py", "--model", model, "--report", str(report)])
+    assert replay.main() == 0
+    assert json.loads(report.read_text())["result"]["frames"] == 1
+
+
+def test_warmup_does_not_consume_frames(model):
+    detector = replay.ShrimpDetector(model, cache_optimized=False)
+    frames = list(replay.iter_frames("synthetic:5", max_frames=4))
+    result = replay.replay(detector, frames, warmup=5)
+    assert result["frames"] == 4
+    assert result["stages"]["total"]["count"] == 4
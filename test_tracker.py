@@ -0,0 +1,64 @@
+"""Counting accuracy of the tracker on synthetic scenes (python -m pytest)."""
+import numpy as np
+import pytest
+
+from scene_sim import run_density
+from tracker import CentroidTracker
+
+
+@pytest.mark.parametrize("count, false_positives", [(20, 2.0), (50, 1.0), (100, 1.0)])
+def test_false_positives_do_not_inflate_count(count, false_positives):
+    r = run_density(count, false_positives=false_positives)
+    gt = r["gt_crossings"]
+    assert r["counted"] <= gt * 1.1 + 3, r
+    assert r["counted"] >= gt * 0.9 - 3, r
+
+
+@pytest.mark.parametrize("count, occlusion, noise", [(20, 0.3, 1.0), (100, 0.3, 0.0)])
+def test_occlusion_does_not_inflate_count(count, occlusion, noise):
+    r = run_density(count, occlusion=occlusion, noise=noise)
+    assert r["counted"] <= r["gt_crossings"] + 2, r
+
+
+@pytest.mark.parametrize("count", [30, 100])
+def test_dense_fast_movers_between_inferences(count):
+    # 30 px/frame with inference on every 3rd frame: shrimp move further
+    # between updates than they are apart
+    r = run_density(count, speed=30.0, infer_every=3)
+    gt = r["gt_crossings"]
+    assert gt * 0.9 <= r["counted"] <= gt * 1.1, r
+
+
+def test_skipped_frames_keep_tracks():
+    # Motion-gated frames longer than max_disappeared_frames, after which
+    # the shrimp move on
+    tracker = CentroidTracker(max_distance=30, max_disappeared_frames=10, counting_line_x=1000)
+    centers = np.array([[100.0, 50.0], [200.0, 150.0]])
+    velocity = np.array([5.0, 0.0])
+    for _ in range(5):
+        tracker.update(centers)
+        centers = centers + velocity
+    ids = tracker.ids.copy()
+
+    for _ in range(15):
+        tracker.skip()
+    tracker.update(centers)
+    assert tracker.ids.tolist() == ids.tolist()
+    assert tracker.unseen.tolist() == [0, 0]
+
+
+@pytest.mark.parametrize("speed", [6.0, 8.0, 10.0])
+def test_stop_short_of_line_then_resume_counts_once(speed):
+    # The shrimp stops just before the line while the scene is motion
+    # gated; its stale velocity must not carry it across the line
+    tracker = CentroidTracker(max_distance=52, max_disappeared_frames=10, counting_line_x=208)
+    total, x = 0, 60.0
+    while x < 178.0:
+        total += tracker.update([[x, 100.0]])
+        x += speed
+    for _ in range(15):
+        tracker.skip()
+    for _ in range(20):
+        x += speed
+        total += tracker.update([[x, 100.0]])
+    assert total == 1
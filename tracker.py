@@ -0,0 +1,510 @@
+import numpy as np
+
+# SciPy is optional: its assignment solver and connected components are
+# used when installed, otherwise the NumPy fallbacks below take over
+# (2-3x slower once hundreds of shrimp chain into large clusters).
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_lsa
+    from scipy.sparse import coo_matrix as _coo_matrix
+    from scipy.sparse.csgraph import connected_components as _connected_components
+except ImportError:
+    _scipy_lsa = None
+    _connected_components = None
+
+# Cost used for pairs outside the gate (finite so the solver stays stable)
+_GATED_OUT = 1e6
+
+# Spatial-hash key layout: cells are offset so negative coordinates are fine
+_CELL_OFFSET = 1 << 20
+_CELL_STRIDE = 1 << 21
+
+
+# ---------------------------------------------------------------
+# Assignment solver
+# ---------------------------------------------------------------
+def linear_sum_assignment(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix.
+
+    Returns (row_indices, col_indices) like scipy.optimize. Uses SciPy when
+    available, otherwise a NumPy shortest-augmenting-path Hungarian solver
+    (O(n^2 m) with the inner loop vectorized over columns).
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    if _scipy_lsa is not None:
+        return _scipy_lsa(cost)
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Potentials and matching, 1-based with column 0 as the virtual root
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)    # p[j] = row matched to column j
+    way = np.zeros(m + 1, dtype=np.intp)
+
+    # Row reduction: with u at the row minima the potentials stay feasible,
+    # so every row whose cheapest column no other row wants is matched
+    # right away and only the contested rows need an augmenting path
+    best = np.argmin(cost, axis=1)
+    u[1:] = cost[np.arange(n), best]
+    _, first, counts = np.unique(best, return_index=True, return_counts=True)
+    lone = first[counts == 1]
+    p[best[lone] + 1] = lone + 1
+    matched = np.zeros(n + 1, dtype=bool)
+    matched[lone + 1] = True
+
+    for i in np.flatnonzero(~matched[1:]) + 1:
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+# ---------------------------------------------------------------
+# Spatial-hash gating
+# ---------------------------------------------------------------
+def _cell_key(cx, cy):
+    return (cx + _CELL_OFFSET) * _CELL_STRIDE + (cy + _CELL_OFFSET)
+
+
+def gated_pairs(track_pos, det_pos, radius):
+    """
+    All (track, detection) pairs closer than `radius`.
+
+    `radius` is a scalar or a per-track array. Detections are binned into a
+    grid of cells as large as the biggest radius, and each track only looks
+    at its own and the 8 neighbouring cells, so the work grows with the
+    number of nearby pairs rather than tracks x detections.
+    Returns (track_idx, det_idx, dist) arrays.
+    """
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+             np.empty(0, dtype=np.float32))
+    if len(track_pos) == 0 or len(det_pos) == 0:
+        return empty
+
+    radius = np.broadcast_to(np.asarray(radius, dtype=np.float32), (len(track_pos),))
+    cell = float(radius.max())
+    track_cells = np.floor(track_pos / cell).astype(np.int64)
+    det_cells = np.floor(det_pos / cell).astype(np.int64)
+    det_keys = _cell_key(det_cells[:, 0], det_cells[:, 1])
+    det_order = np.argsort(det_keys, kind="stable")
+    sorted_keys = det_keys[det_order]
+
+    track_idx, det_idx = [], []
+    track_range = np.arange(len(track_pos))
+    for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+            keys = _cell_key(track_cells[:, 0] + ox, track_cells[:, 1] + oy)
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            hi = np.searchsorted(sorted_keys, keys, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand each [lo, hi) range into explicit positions
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            track_idx.append(np.repeat(track_range, counts))
+            det_idx.append(det_order[starts + np.arange(total)])
+
+    if not track_idx:
+        return empty
+    track_idx = np.concatenate(track_idx)
+    det_idx = np.concatenate(det_idx)
+    dist = np.linalg.norm(track_pos[track_idx] - det_pos[det_idx], axis=1)
+    keep = dist < radius[track_idx]
+    return track_idx[keep], det_idx[keep], dist[keep].astype(np.float32)
+
+
+def _components(n_tracks, n_dets, track_idx, det_idx):
+    """Label the connected components of the gated bipartite graph."""
+    n = n_tracks + n_dets
+    if _connected_components is not None:
+        graph = _coo_matrix(
+            (np.ones(len(track_idx)), (track_idx, det_idx + n_tracks)), shape=(n, n)
+        )
+        return _connected_components(graph, directed=False)[1]
+
+    # Min-label propagation: every node takes the smallest label among its
+    # edges, then follows its label's label (pointer jumping), until stable
+    labels = np.arange(n)
+    t_node, d_node = track_idx, det_idx + n_tracks
+    while True:
+        low = np.minimum(labels[t_node], labels[d_node])
+        new = labels.copy()
+        np.minimum.at(new, t_node, low)
+        np.minimum.at(new, d_node, low)
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+# ---------------------------------------------------------------
+# Centroid tracker
+# ---------------------------------------------------------------
+class CentroidTracker:
+    """
+    Centroid tracker with line-crossing counting.
+
+    Track state lives in parallel NumPy arrays ordered by track id. Two
+    matching modes:
+
+    - "optimal": spatially gated minimum-distance assignment, solved per
+      connected cluster of nearby tracks/detections.
+    - "greedy": the original behaviour, each track (in id order) takes its
+      closest free detection.
+
+    With motion prediction on, every track carries a constant-velocity
+    estimate (an alpha-beta filter, i.e. a steady-state Kalman filter).
+    Each update first predicts positions `dt` frames ahead and matches
+    detections against the predictions, so inference can run every 2nd
+    or 3rd camera frame. Crossings are tested on the path from a track's
+    last measured position to its new one, which catches shrimp that
+    crossed the line between inferences. Tracks with at least
+    `min_hits_to_coast` measurements are also counted when their
+    predicted path crosses the line while they are briefly undetected.
+    New tracks inherit the flow of the established ones, or, when there
+    are none, the scene's most common displacement.
+
+    Until a track has `min_hits_to_coast` hits it is tentative: false
+    positives chain into such tracks, so a tentative track's crossing is
+    only counted once the track is confirmed, and a tentative track is
+    dropped after `max_tentative_unseen` missed updates.
+    """
+
+    MODES = ("optimal", "greedy")
+
+    # Per-track arrays: (name, dtype, trailing shape)
+    _FIELDS = (
+        ("ids", np.int64, ()),
+        ("positions", np.float32, (2,)),       # current (predicted/filtered) estimate
+        ("velocities", np.float32, (2,)),      # pixels per frame
+        ("last_measured", np.float32, (2,)),   # last matched detection
+        ("since_measured", np.float32, ()),    # frames since last_measured
+        ("unseen", np.int32, ()),              # updates without a match
+        ("hits", np.int32, ()),                # number of matched detections
+        ("counted", bool, ()),
+        ("pending", bool, ()),                 # crossed while tentative
+    )
+
+    def __init__(self, max_distance, max_disappeared_frames, counting_line_x,
+                 mode="optimal", motion_prediction=True, alpha=0.85, beta=0.35,
+                 min_hits_to_coast=3, max_tentative_unseen=2):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown tracker mode '{mode}', expected one of {self.MODES}")
+        self.max_distance = max_distance
+        self.max_disappeared_frames = max_disappeared_frames
+        self.counting_line_x = counting_line_x
+        self.mode = mode
+        self.motion_prediction = motion_prediction
+        self.alpha = alpha
+        self.beta = beta
+        self.min_hits_to_coast = min_hits_to_coast
+        self.max_tentative_unseen = max_tentative_unseen
+        self.reset()
+
+    def reset(self):
+        for name, dtype, shape in self._FIELDS:
+            setattr(self, name, np.empty((0,) + shape, dtype=dtype))
+        self.next_track_id = 0
+        self.skipped_dt = 0.0        # frames skipped since the last update
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keep(self, mask):
+        for name, _, _ in self._FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+    def _register(self, centers):
+        n = len(centers)
+        ids = np.arange(self.next_track_id, self.next_track_id + n, dtype=np.int64)
+        self.next_track_id += n
+        new = {
+            "ids": ids,
+            "positions": centers,
+            "last_measured": centers,
+            "hits": np.ones(n, dtype=np.int32),
+        }
+        # Shrimp in the chute share the flow, so new tracks start with the
+        # median velocity of the established ones
+        if self.motion_prediction:
+            established = self.hits >= 2
+            if established.any():
+                prior = np.median(self.velocities[established], axis=0)
+                new["velocities"] = np.tile(prior, (n, 1))
+        for name, dtype, shape in self._FIELDS:
+            values = new.get(name)
+            if values is None:
+                values = np.zeros((n,) + shape, dtype=dtype)
+            setattr(self, name, np.concatenate([getattr(self, name), values.astype(dtype)]))
+
+    # ---------------------------------------------------------------
+    # Views used by drawing / snapshots
+    # ---------------------------------------------------------------
+    def as_dict(self):
+        """{id: (cx, cy, frames_unseen)} for the active tracks."""
+        return dict(zip(
+            self.ids.tolist(),
+            zip(self.positions[:, 0].tolist(), self.positions[:, 1].tolist(),
+                self.unseen.tolist()),
+        ))
+
+    def counted_ids(self):
+        return set(self.ids[self.counted].tolist())
+
+    # ---------------------------------------------------------------
+    # Matching
+    # ---------------------------------------------------------------
+    def _gate_radius(self):
+        """
+        Per-track matching radius. Tracks with a velocity estimate are
+        matched within max_distance of their prediction; new tracks with
+        no velocity yet have a gate that grows with the frames elapsed,
+        up to twice max_distance (a one-frame false positive must not
+        reach across the chute). After skipped frames every gate widens
+        with the gap, again up to twice max_distance, for shrimp that
+        drifted too slowly to trip the motion gate.
+        """
+        radius = np.full(len(self.ids), self.max_distance, dtype=np.float32)
+        if self.skipped_dt:
+            radius *= min(1.0 + self.skipped_dt / self.max_disappeared_frames, 2.0)
+        if self.motion_prediction:
+            fresh = (self.hits < 2) & ~self.velocities.any(axis=1)
+            radius[fresh] = np.maximum(
+                radius[fresh], self.max_distance * np.clip(self.since_measured[fresh], 1.0, 2.0))
+        return radius
+
+    def _seed_velocities(self, centers):
+        """
+        Start new tracks that have no velocity (nothing established to
+        take a prior from, e.g. at startup) on the common flow of the
+        scene: the most frequent displacement from them to the detections
+        within their gate. Correct pairs share the flow while wrong ones
+        scatter, so a dense, fast scene does not lock onto neighbours.
+        """
+        seed = np.flatnonzero((self.hits < 2) & ~self.velocities.any(axis=1))
+        if len(seed) == 0:
+            return
+        elapsed = self.since_measured[seed]
+        t_idx, d_idx, _ = gated_pairs(self.positions[seed], centers,
+                                      self.max_distance * np.clip(elapsed, 1.0, 2.0))
+        if len(t_idx) == 0:
+            return
+        shift = centers[d_idx] - self.positions[seed[t_idx]]
+        bins = np.floor(shift / (self.max_distance / 4)).astype(np.int64)
+        keys, counts = np.unique(_cell_key(bins[:, 0], bins[:, 1]), return_counts=True)
+        peak = keys[np.argmax(counts)]
+        near = np.zeros(len(shift), dtype=bool)
+        for ox in (-1, 0, 1):
+            for oy in (-1, 0, 1):
+                near |= _cell_key(bins[:, 0] + ox, bins[:, 1] + oy) == peak
+        flow = np.median(shift[near], axis=0)
+        self.positions[seed] += flow
+        self.velocities[seed] = flow / np.maximum(elapsed, 1.0)[:, None]
+
+    def _match_greedy(self, centers):
+        dist = np.linalg.norm(self.positions[:, None] - centers[None], axis=2)
+        radius = self._gate_radius()
+        rows, cols = [], []
+        for i in range(len(self.ids)):
+            j = int(np.argmin(dist[i]))
+            if dist[i, j] < radius[i]:
+                rows.append(i)
+                cols.append(j)
+                dist[:, j] = np.inf
+        return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+    def _match_optimal(self, centers):
+        radius = self._gate_radius()
+        t_idx, d_idx, dist = gated_pairs(self.positions, centers, radius)
+        if len(t_idx) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        n_tracks = len(self.ids)
+        labels = _components(n_tracks, len(centers), t_idx, d_idx)
+        pair_labels = labels[t_idx]
+
+        rows, cols = [], []
+        order = np.argsort(pair_labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(pair_labels[order])) + 1
+        for group in np.split(order, bounds):
+            gt, gd, gdist = t_idx[group], d_idx[group], dist[group]
+            if len(group) == 1:
+                # Isolated pair: inside the track's gate, so it is taken
+                # just as the solver below would take it
+                rows.append(gt)
+                cols.append(gd)
+                continue
+            ut, t_local = np.unique(gt, return_inverse=True)
+            ud, d_local = np.unique(gd, return_inverse=True)
+            # One extra "stay unmatched" column per track, costing the
+            # track's gate radius. Otherwise the solver maximises the number
+            # of matches first: a lost track drags a chain of neighbours
+            # onto the wrong shrimp, and a young track (often a false
+            # positive) steals a real shrimp from an established neighbour.
+            nt, nd = len(ut), len(ud)
+            cost = np.full((nt, nd + nt), _GATED_OUT)
+            cost[t_local, d_local] = gdist
+            cost[np.arange(nt), nd + np.arange(nt)] = radius[ut]
+            r, c = linear_sum_assignment(cost)
+            ok = c < nd
+            rows.append(ut[r[ok]])
+            cols.append(ud[c[ok]])
+
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def _crossed(self, old_x, new_x, rows):
+        """Mask of `rows` whose path old_x -> new_x crosses the line for the first time."""
+        return ((old_x < self.counting_line_x)
+                & (new_x >= self.counting_line_x)
+                & ~self.counted[rows] & ~self.pending[rows])
+
+    def _drop_lost(self):
+        alive = (self.unseen <= self.max_disappeared_frames) & (
+            (self.hits >= self.min_hits_to_coast) | (self.unseen <= self.max_tentative_unseen))
+        if not alive.all():
+            self._keep(alive)
+
+    # ---------------------------------------------------------------
+    # Update
+    # ---------------------------------------------------------------
+    def predict(self, dt=1.0):
+        """Advance every track `dt` frames along its velocity."""
+        if self.motion_prediction and len(self.ids):
+            self.positions += self.velocities * np.float32(dt)
+        self.since_measured += np.float32(dt)
+
+    def skip(self, dt=1.0):
+        """
+        `dt` frames went by without inference (static scene). Nothing was
+        measured, so no track is missed. Nothing moved either: the next
+        update does not extrapolate across the gap, it only widens the
+        gates (see _gate_radius).
+        """
+        self.skipped_dt += dt
+        self.since_measured += np.float32(dt)
+
+    def update(self, centers, dt=1.0):
+        """
+        Predict `dt` frames ahead, match (N, 2) centroids to the predicted
+        tracks, count line crossings and age or drop unmatched tracks.
+        Returns the number of new crossings.
+        """
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        n_tracks = len(self.ids)
+        crossings = 0
+
+        prev_positions = self.positions.copy()
+        self.predict(dt)
+
+        if n_tracks and len(centers):
+            if self.motion_prediction:
+                self._seed_velocities(centers)
+            if self.mode == "optimal":
+                rows, cols = self._match_optimal(centers)
+            else:
+                rows, cols = self._match_greedy(centers)
+        else:
+            rows = cols = np.empty(0, dtype=np.intp)
+
+        matched = np.zeros(n_tracks, dtype=bool)
+        matched[rows] = True
+        if len(rows):
+            measured = centers[cols]
+
+            # --- CHECK FOR COUNTING LINE CROSS ---
+            # Tested on the measured path, which spans any skipped frames.
+            # A track seen only once may have been a false positive, so its
+            # first re-association only counts over a plausible one-step move.
+            crossed = self._crossed(self.last_measured[rows, 0], measured[:, 0], rows)
+            step = np.linalg.norm(measured - self.last_measured[rows], axis=1)
+            crossed &= (self.hits[rows] >= 2) | (step <= self.max_distance)
+            self.pending[rows[crossed]] = True
+
+            # Alpha-beta correction of position and velocity
+            # (a track's first velocity comes straight from its first two
+            # measurements, like a Kalman filter with no prior). Skipped
+            # frames were static, so they do not dilute the velocity.
+            residual = measured - self.positions[rows]
+            if self.motion_prediction:
+                elapsed = np.maximum(self.since_measured[rows] - self.skipped_dt, 1.0)[:, None]
+                fresh = (self.hits[rows] < 2)[:, None]
+                alpha = np.where(fresh, 1.0, self.alpha).astype(np.float32)
+                beta = np.where(fresh, 1.0, self.beta).astype(np.float32)
+                self.velocities[rows] += beta * residual / elapsed
+                self.positions[rows] += alpha * residual
+            else:
+                self.positions[rows] = measured
+
+            self.last_measured[rows] = measured
+            self.since_measured[rows] = 0
+            self.unseen[rows] = 0
+            self.hits[rows] += 1
+
+            # Count crossings of confirmed tracks, including those held
+            # back while the track was tentative
+            ready = rows[self.pending[rows] & (self.hits[rows] >= self.min_hits_to_coast)]
+            crossings += len(ready)
+            self.counted[ready] = True
+            self.pending[ready] = False
+
+        lost = ~matched
+        self.unseen[lost] += 1
+
+        # Coasting tracks with a confirmed velocity may cross on prediction,
+        # unless the scene was static until now: their velocity is stale
+        if self.motion_prediction and lost.any() and not self.skipped_dt:
+            coast = np.flatnonzero(lost & (self.hits >= self.min_hits_to_coast))
+            if len(coast):
+                crossed = self._crossed(prev_positions[coast, 0], self.positions[coast, 0], coast)
+                crossings += int(crossed.sum())
+                self.counted[coast[crossed]] = True
+
+        # Register new tracks from unmatched detections
+        unmatched = np.ones(len(centers), dtype=bool)
+        unmatched[cols] = False
+        if unmatched.any():
+            self._register(centers[unmatched])
+
+        # Clean up old, lost tracks
+        self._drop_lost()
+        self.skipped_dt = 0.0
+
+        return crossings
@@ -1,4 +1,4 @@
-import sys, cv2, datetime, os
+import sys, cv2, datetime, os, time
 # Subprocess is no longer needed
 # os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "0" # These are set in run_shrimp_app.sh
 # os.environ["QT_SCALE_FACTOR"] = "1"
@@ -7,9 +7,11 @@ import sys, cv2, datetime, os
 # os.environ.setdefault("QT_QPA_PLATFORM", "wayland") # This was commented out
 
 from PyQt5 import QtWidgets, QtGui, QtCore
+import metrics, profiler
 from compute import compute_feed
 from detector import ShrimpDetector
-from camera import Camera
+from frame_sources import open_source
+from pipeline import DetectionPipeline
 from database import save_biomass_record
 from theme import *
 from mqtt_client import MqttClient
@@ -19,6 +21,9 @@ def qt_exception_hook(exctype, value, traceback):
     print("Unhandled Exception:", value)
 sys.excepthook = qt_exception_hook
 
+# QImage.Format_BGR888 needs Qt 5.14+; older builds fall back to one cvtColor
+HAS_BGR888 = hasattr(QtGui.QImage, "Format_BGR888")
+
 
 # --- NEW: Custom Numpad Dialog ---
 class NumberInputDialog(QtWidgets.QDialog):
@@ -166,36 +171,154 @@ class PumpControlDialog(QtWidgets.QDialog):
         print("MQTT: Sending PUMP OFF")
         self.mqtt.publish("shrimp/pump/command", "PUMP OFF")
 
-# --- Video Label (Unchanged) ---
+# --- Video Label ---
 class VideoLabel(QtWidgets.QLabel):
-    # (This class is unchanged)
-    def __init__(self):
+    # Frames are BGR end to end; the QImage wraps the NumPy buffer directly.
+    # Repaints are capped at `max_fps` and scaled inside paintEvent into a
+    # cached target rect. In live mode the newest camera frame is pulled on
+    # every tick and the latest detection overlay is painted on top, so the
+    # view stays smooth however slowly inference runs.
+    def __init__(self, max_fps=30, smooth=False):
         super().__init__()
         self.setAlignment(QtCore.Qt.AlignCenter)
         self.setStyleSheet("border: 2px solid #0077cc; border-radius: 8px; background-color: black;")
         self.setMinimumSize(640, 240)
         self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-    def set_frame(self, frame):
+        self.smooth = smooth        # SmoothTransformation costs a lot on the Pi
+        self._frame = None          # NumPy buffer backing self._image
+        self._image = None
+        self._target = QtCore.QRect()
+        self._overlay = None
+        self._dirty = False
+        self._source = None         # callable -> newest CapturedFrame (live mode)
+        self._source_seq = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._tick)
+        self.set_max_fps(max_fps)
+        self._timer.start()
+
+    def set_max_fps(self, fps):
+        self._timer.setInterval(max(1, int(1000 / fps)))
+
+    def set_frame(self, frame, overlay=None):
         try:
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb.shape
-            qimg = QtGui.QImage(rgb.data, w, h, ch * w, QtGui.QImage.Format_RGB888)
-            pix = QtGui.QPixmap.fromImage(qimg)
-            pix = pix.scaled(self.width(), self.height(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-            self.setPixmap(pix)
+            self._set_image(frame)
+            self._overlay = overlay
         except Exception as e:
             print("Error displaying frame:", e)
 
+    def set_overlay(self, overlay):
+        """Paint `overlay` (a detector Overlay) over whatever frame is shown."""
+        self._overlay = overlay
+        self._dirty = True
+
+    def start_live(self, source):
+        """Follow `source()` (e.g. Camera.peek_latest) at the display rate."""
+        self._source = source
+        self._source_seq = None
+
+    def stop_live(self):
+        self._source = None
+
+    def _set_image(self, frame):
+        h, w, ch = frame.shape
+        if HAS_BGR888:
+            # No colour conversion: Qt reads the BGR buffer as-is
+            image = QtGui.QImage(frame.data, w, h, frame.strides[0], QtGui.QImage.Format_BGR888)
+        else:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            image = QtGui.QImage(frame.data, w, h, frame.strides[0], QtGui.QImage.Format_RGB888)
+        resized = self._image is None or self._image.size() != image.size()
+        # Keep the buffer alive as long as the QImage points into it
+        self._frame, self._image = frame, image
+        if resized:
+            self._update_target()
+        self._dirty = True
+
+    def _tick(self):
+        if self._source is not None:
+            captured = self._source()
+            if captured is not None and captured.seq != self._source_seq:
+                self._source_seq = captured.seq
+                self._set_image(captured.image)
+        if self._dirty:
+            self._dirty = False
+            self.update()
+
+    def _update_target(self):
+        """Aspect-fit rect of the current image, recomputed only on resize."""
+        if self._image is None:
+            return
+        area = self.contentsRect()
+        size = self._image.size().scaled(area.size(), QtCore.Qt.KeepAspectRatio)
+        self._target = QtCore.QRect(QtCore.QPoint(0, 0), size)
+        self._target.moveCenter(area.center())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_target()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._image is None:
+            return
+        with metrics.timed("ui_paint"):
+            painter = QtGui.QPainter(self)
+            painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, self.smooth)
+            painter.drawImage(self._target, self._image)
+            if self._overlay is not None:
+                self._paint_overlay(painter, self._overlay)
+            painter.end()
+
+    def _paint_overlay(self, painter, overlay):
+        # Same marks as ShrimpDetector.draw, painted in frame coordinates
+        painter.save()
+        painter.translate(self._target.topLeft())
+        painter.scale(self._target.width() / self._image.width(),
+                      self._target.height() / self._image.height())
+
+        pen = QtGui.QPen(QtGui.QColor(0, 255, 0), 1)
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        for x1, y1, x2, y2 in overlay.boxes:
+            painter.drawRect(int(x1), int(y1), int(x2 - x1), int(y2 - y1))
+
+        for cx, cy, tid, counted in overlay.points:
+            color = QtGui.QColor(255, 0, 0) if counted else QtGui.QColor(0, 0, 255)
+            painter.setPen(color)
+            painter.setBrush(color)
+            painter.drawEllipse(QtCore.QPoint(cx, cy), 4, 4)
+            painter.drawText(cx + 5, cy + 5, str(tid))
+        painter.setBrush(QtCore.Qt.NoBrush)
+
+        if overlay.line_x is not None:
+            pen = QtGui.QPen(QtGui.QColor(255, 255, 0), 2)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawLine(overlay.line_x, 0, overlay.line_x, self._image.height())
+        painter.restore()
+
+        painter.setPen(QtGui.QColor(0, 255, 0))
+        origin = self._target.topLeft()
+        painter.drawText(origin + QtCore.QPoint(15, 25), overlay.status)
+        painter.drawText(origin + QtCore.QPoint(15, 45), overlay.detail)
+
 
 class BiomassWindow(QtWidgets.QWidget):
-    def __init__(self, user_id, parent=None):
+    def __init__(self, user_id, parent=None, source=None):
         super().__init__()
         # (Init section is unchanged)
         self.parent = parent
         self.user_id = user_id
-        self.detector = ShrimpDetector()
-        self.camera = Camera()
+        self.detector = ShrimpDetector(motion_gating=True)
+        # Frame source: the tank camera unless a file/synthetic/raw source is
+        # given here or in SHRIMP_FRAME_SOURCE (see frame_sources.open_source)
+        self.camera = open_source(source or os.environ.get("SHRIMP_FRAME_SOURCE"), loop=True)
+        # The video widget follows the camera itself; the pipeline only
+        # sends the overlay to paint on top
+        self.pipeline = DetectionPipeline(self.camera, self.detector, draw_frames=False, parent=self)
         self.mqtt = MqttClient()
+        profiler.attach_mqtt(self.mqtt)
         self.mqtt.connect()
         self.running = False
         self.count = 0
@@ -215,6 +338,10 @@ class BiomassWindow(QtWidgets.QWidget):
         self.lblTitle = QtWidgets.QLabel("Biomass Calculation")
         self.lblTitle.setAlignment(QtCore.Qt.AlignCenter)
         self.lblTitle.setStyleSheet("font-size:20px; font-weight:bold; margin-bottom:6px;")
+        # Hidden gesture: hold the title for 2 s to start/stop the profiler
+        self._title_pressed_at = None
+        self.lblTitle.mousePressEvent = lambda event: setattr(self, "_title_pressed_at", time.monotonic())
+        self.lblTitle.mouseReleaseEvent = lambda event: self.title_released()
         top_bar_layout = QtWidgets.QHBoxLayout()
         top_bar_layout.addWidget(self.btnArrowBack, stretch=0, alignment=QtCore.Qt.AlignLeft)
         top_bar_layout.addWidget(self.lblTitle, stretch=1, alignment=QtCore.Qt.AlignCenter)
@@ -224,6 +351,9 @@ class BiomassWindow(QtWidgets.QWidget):
         self.lblStatus = QtWidgets.QLabel("Idle")
         self.lblStatus.setAlignment(QtCore.Qt.AlignRight)
         self.lblStatus.setStyleSheet("font-size:16px; margin-bottom:6px; color:#555;")
+        self.lblPipeline = QtWidgets.QLabel("")
+        self.lblPipeline.setAlignment(QtCore.Qt.AlignCenter)
+        self.lblPipeline.setStyleSheet("font-size:12px; color:#888;")
         self.lblThresholdStatus = QtWidgets.QLabel("Target Count: Not Set")
         self.lblThresholdStatus.setAlignment(QtCore.Qt.AlignLeft)
         self.lblThresholdStatus.setStyleSheet("font-size:16px; margin-bottom:6px; color:#005fa3; font-weight:bold;")
@@ -231,6 +361,16 @@ class BiomassWindow(QtWidgets.QWidget):
         status_layout.addWidget(self.lblStatus, 1)
         status_layout.addWidget(self.lblThresholdStatus, 1)
         self.video = VideoLabel()
+        # Per-stage latency table (metrics.REGISTRY) over the video; tap the
+        # pipeline line under the counts to toggle it
+        self.lblDiagnostics = QtWidgets.QLabel(self.video)
+        self.lblDiagnostics.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.lblDiagnostics.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 170); color: #7CFC00; font-size:11px; padding:6px;")
+        self.lblDiagnostics.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.lblDiagnostics.move(8, 8)
+        self.lblDiagnostics.setVisible(os.environ.get("SHRIMP_DIAGNOSTICS") == "1")
+        self.lblPipeline.mousePressEvent = lambda event: self.toggle_diagnostics()
         self.lblCount = QtWidgets.QLabel("Count: 0")
         self.lblFeed = QtWidgets.QLabel("Biomass: 0.00g | Feed: 0.00g | Protein: 0.00g | Filler: 0.00g")
         for lbl in [self.lblCount, self.lblFeed]:
@@ -263,6 +403,7 @@ class BiomassWindow(QtWidgets.QWidget):
         layout.setStretch(2, 1)
         layout.addWidget(self.lblCount)
         layout.addWidget(self.lblFeed)
+        layout.addWidget(self.lblPipeline)
         button_row_1 = QtWidgets.QHBoxLayout()
         button_row_1.setSpacing(10)
         button_row_1.setAlignment(QtCore.Qt.AlignCenter)
@@ -275,8 +416,8 @@ class BiomassWindow(QtWidgets.QWidget):
             button_row_2.addWidget(b)
         layout.addLayout(button_row_1)
         layout.addLayout(button_row_2)
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update_frame)
+        self.pipeline.result_ready.connect(self.update_frame)
+        self.pipeline.stats_updated.connect(self.update_pipeline_stats)
         self.btnArrowBack.clicked.connect(self.go_back)
         self.btnStart.clicked.connect(self.start)
         self.btnStop.clicked.connect(self.stop)
@@ -302,14 +443,16 @@ class BiomassWindow(QtWidgets.QWidget):
         # (This function is unchanged)
         if not self.running:
             self.running = True
-            self.timer.start(100)
+            self.pipeline.start()
+            self.video.start_live(self.camera.peek_latest)
             self.lblStatus.setText("Running...")
 
     def stop(self):
         # (This function is unchanged)
         if self.running:
             self.running = False
-            self.timer.stop()
+            self.pipeline.stop()
+            self.video.stop_live()
             self.lblStatus.setText("Stopped")
             self.btnDispense.setEnabled(True)
             self.btnDispense.setStyleSheet(self.make_button_style(self.COLOR_DISPENSE_ACTIVE))
@@ -317,14 +460,15 @@ class BiomassWindow(QtWidgets.QWidget):
     def reset(self):
         # (This function is unchanged)
         self.running = False
-        self.timer.stop()
+        self.pipeline.stop()
+        self.video.stop_live()
         self.mqtt.publish("shrimp/servo1/command", "SERVO1_OPEN")
         self.detector.reset_total_count() 
         frame = self.camera.get_frame()
         if frame is not None:
-            total_count_from_detector, frame_rgb = self.detector.detect(frame, draw=True)
+            total_count_from_detector, frame_bgr = self.detector.detect(frame, draw=True, rgb=False)
             self.count = total_count_from_detector
-            self.video.set_frame(cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR))
+            self.video.set_frame(frame_bgr)
         else:
             self.count = 0
         self.threshold_count = 0 
@@ -341,13 +485,16 @@ class BiomassWindow(QtWidgets.QWidget):
         # (This function is unchanged)
         b, f, p, fl = compute_feed(self.count)
         save_biomass_record(self.user_id, self.count, b, f)
+        if self.parent and hasattr(self.parent, "sync"):
+            self.parent.sync.wake()
         QtWidgets.QMessageBox.information(self, "Saved", "Process saved locally.")
         self.lblStatus.setText("Saved")
         self.btnDispense.setEnabled(True)
         self.btnDispense.setStyleSheet(self.make_button_style(self.COLOR_DISPENSE_ACTIVE))
 
     def go_back(self):
-        self.timer.stop()
+        self.pipeline.stop()
+        self.video.stop_live()
         self.mqtt.disconnect()
         # self.close_keyboard() # <-- This is gone
         try:
@@ -392,23 +539,52 @@ class BiomassWindow(QtWidgets.QWidget):
         print("MQTT: Sending DISPENSE command")
         self.mqtt.publish("shrimp/servo3/command", "SERVO3_DISPENSE")
 
-    def update_frame(self):
-        # (This function is unchanged)
-        frame = self.camera.get_frame()
-        if frame is None:
-            print("Failed to get frame from camera.")
-            return
-        count, frame_rgb = self.detector.detect(frame)
+    def update_frame(self, result):
+        # Slot for DetectionPipeline.result_ready (runs on the GUI thread)
+        count = result.total_count
         self.count = count
         if self.threshold_count > 0 and not self.threshold_reached:
             if self.count >= self.threshold_count:
                 print(f"Target count reached ({self.count})! Sending CLOSE command.")
                 self.mqtt.publish("shrimp/servo1/command", "SERVO1_CLOSE")
                 self.threshold_reached = True
-        b, f, p, fl = compute_feed(count)
+        b, f, p, fl = result.feed
         self.lblCount.setText(f"Count: {count}")
         self.lblFeed.setText(f"Biomass: {b:.2f}g | Feed: {f:.2f}g | Protein: {p:.2f}g | Filler: {fl:.2f}g")
-        self.video.set_frame(cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR))
+        if result.overlay is not None:
+            self.video.set_overlay(result.overlay)
+        else:
+            self.video.set_frame(result.frame)
+
+    def update_pipeline_stats(self, report):
+        perf = self.detector.performance_report()
+        self.lblPipeline.setText(
+            f"{perf['profile']} {perf['measured_fps']:.1f} FPS | "
+            + DetectionPipeline.format_stats(report)
+        )
+        if self.lblDiagnostics.isVisible():
+            self.refresh_diagnostics()
+
+    def title_released(self):
+        pressed_at, self._title_pressed_at = self._title_pressed_at, None
+        if pressed_at is None or time.monotonic() - pressed_at < 2.0:
+            return
+        if profiler.PROFILER.is_running():
+            profiler.PROFILER.stop()
+            self.lblStatus.setText("Profiler stopped")
+        else:
+            profiler.PROFILER.start()
+            self.lblStatus.setText(f"Profiling {profiler.PROFILER.duration_s:g} s...")
+
+    def toggle_diagnostics(self):
+        self.lblDiagnostics.setVisible(not self.lblDiagnostics.isVisible())
+        if self.lblDiagnostics.isVisible():
+            self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        self.lblDiagnostics.setText(metrics.REGISTRY.format_table())
+        self.lblDiagnostics.adjustSize()
+        self.lblDiagnostics.raise_()
 
     # (Helper function and main block are unchanged)
     def make_button_style(self, color):
@@ -5,18 +5,199 @@ os.environ["QT_SCALE_FACTOR"] = "1"
 os.environ["QT_FONT_DPI"] = "96"
 os.environ["QT_SCREEN_SCALE_FACTORS"] = "1"
 os.environ.setdefault("QT_QPA_PLATFORM", "wayland")  # or eglfs if using kiosk mode
-import datetime
+import datetime, time
+from collections import namedtuple
 from PyQt5 import QtWidgets, QtGui, QtCore
-from database import get_all_records, delete_record, sync_biomass_records
+from database import get_records_page, get_records_newer, get_records_by_ids, delete_record
+from sync_engine import SyncEngine
 from theme import *
 
+# One history row, with its display strings formatted once when loaded
+HistoryRow = namedtuple("HistoryRow", ["id", "synced", "title", "lines"])
+
+PAGE_SIZE = 50
+
+
+def make_history_row(rec):
+    """biomass_records row -> HistoryRow."""
+    shrimpCount, biomass, feed, date, synced = rec[3], rec[4], rec[5], rec[6], rec[7]
+    try:
+        date_str = datetime.datetime.fromisoformat(date).strftime("%b %d, %Y • %I:%M %p")
+    except Exception:
+        date_str = str(date)
+    return HistoryRow(
+        id=rec[0],
+        synced=bool(synced),
+        title=f"Process on {date_str}",
+        lines=(
+            f"Shrimp Count: {shrimpCount}",
+            f"Biomass: {biomass or 0:.3f} g",
+            f"Feed: {feed or 0:.3f} g",
+            f"Status: {'✅ Synced' if synced else '❌ Not Synced'}",
+        ),
+    )
+
+
+class RecordListModel(QtCore.QAbstractListModel):
+    """
+    A user's records, newest first, loaded a page at a time as the view
+    scrolls (canFetchMore/fetchMore). Changes are applied per row:
+    refresh_rows() after a sync, remove_record() after a delete and
+    fetch_newer() for records saved since the list was opened.
+    """
+
+    RowRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, user_id, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.page_size = page_size
+        self._rows = []
+        self._index = {}        # record id -> row number
+        self._exhausted = False
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == self.RowRole:
+            return row
+        if role == QtCore.Qt.DisplayRole:
+            return row.title
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        before = self._rows[-1].id if self._rows else None
+        records = get_records_page(self.user_id, before_id=before, limit=self.page_size)
+        if len(records) < self.page_size:
+            self._exhausted = True
+        if not records:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(records) - 1)
+        self._rows.extend(make_history_row(rec) for rec in records)
+        self._reindex()
+        self.endInsertRows()
+
+    def _reindex(self):
+        self._index = {row.id: i for i, row in enumerate(self._rows)}
+
+    def record_id(self, index):
+        return self._rows[index.row()].id if index.isValid() else None
+
+    def index_of(self, record_id):
+        i = self._index.get(record_id)
+        return self.index(i) if i is not None else QtCore.QModelIndex()
+
+    def fetch_newer(self):
+        """Prepend records saved after the newest loaded one."""
+        if not self._rows:
+            if self._exhausted:
+                self._exhausted = False
+                self.fetchMore()
+            return
+        records = get_records_newer(self.user_id, self._rows[0].id)
+        if not records:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), 0, len(records) - 1)
+        self._rows[:0] = [make_history_row(rec) for rec in records]
+        self._reindex()
+        self.endInsertRows()
+
+    def refresh_rows(self, record_ids=None):
+        """Re-read loaded rows (all unsynced ones by default) and repaint only those that changed."""
+        if record_ids is None:
+            record_ids = [row.id for row in self._rows if not row.synced]
+        record_ids = [rid for rid in record_ids if rid in self._index]
+        if not record_ids:
+            return
+        current = {rec[0]: make_history_row(rec) for rec in get_records_by_ids(self.user_id, record_ids)}
+        for rid in record_ids:
+            row = current.get(rid)
+            if row is None:
+                self.remove_record(rid)
+            elif row != self._rows[self._index[rid]]:
+                i = self._index[rid]
+                self._rows[i] = row
+                self.dataChanged.emit(self.index(i), self.index(i))
+
+    def remove_record(self, record_id):
+        i = self._index.get(record_id)
+        if i is None:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), i, i)
+        del self._rows[i]
+        self._reindex()
+        self.endRemoveRows()
+
+
+class RecordCardDelegate(QtWidgets.QStyledItemDelegate):
+    """Paints a record as the history card (no per-row widgets)."""
+
+    CARD_HEIGHT = 128
+    SPACING = 8
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QtGui.QFont(FONT_FAMILY)
+        self.title_font.setPixelSize(16)
+        self.title_font.setBold(True)
+        self.body_font = QtGui.QFont(FONT_FAMILY)
+        self.body_font.setPixelSize(14)
+        self.line_height = QtGui.QFontMetrics(self.body_font).height() + 2
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(option.rect.width(), self.CARD_HEIGHT + self.SPACING)
+
+    def paint(self, painter, option, index):
+        row = index.data(RecordListModel.RowRole)
+        if row is None:
+            return
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        card = QtCore.QRectF(option.rect.adjusted(2, 2, -2, -self.SPACING))
+
+        selected = option.state & QtWidgets.QStyle.State_Selected
+        border = QtGui.QColor("#4CAF50" if row.synced else "#ff9800")
+        background = QtGui.QColor("#e8f5e9" if row.synced else "#fff5e6")
+        if selected:
+            border, background = QtGui.QColor("#0078D7"), QtGui.QColor("#f1faff")
+        painter.setPen(QtGui.QPen(border, 3 if selected else 2))
+        painter.setBrush(background)
+        painter.drawRoundedRect(card, 10, 10)
+
+        text = card.adjusted(16, 10, -16, -8)
+        painter.setPen(QtGui.QColor("#0077cc"))
+        painter.setFont(self.title_font)
+        title_height = QtGui.QFontMetrics(self.title_font).height() + 4
+        painter.drawText(QtCore.QRectF(text.left(), text.top(), text.width(), title_height),
+                         QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, row.title)
+
+        painter.setPen(QtGui.QColor(TEXT_COLOR))
+        painter.setFont(self.body_font)
+        y = text.top() + title_height
+        for line in row.lines:
+            painter.drawText(QtCore.QRectF(text.left(), y, text.width(), self.line_height),
+                             QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, line)
+            y += self.line_height
+        painter.restore()
+
+
 class HistoryWindow(QtWidgets.QWidget):
-    def __init__(self, parent, user_id):
+    def __init__(self, parent, user_id, sync=None):
         super().__init__()
         self.parent = parent
         self.user_id = user_id
-        self.selectedRecordId = None
-        self.selectedCard = None
+        if sync is None:
+            sync = SyncEngine(user_id, parent=self)
+            sync.start()
+        self.sync = sync
 
         # --- Window configuration ---
         self.setWindowFlag(QtCore.Qt.FramelessWindowHint)
@@ -33,16 +214,28 @@ class HistoryWindow(QtWidgets.QWidget):
         self.lblTitle.setAlignment(QtCore.Qt.AlignCenter)
         self.lblTitle.setStyleSheet("font-size:18px; font-weight:bold; margin-bottom:8px; color:#0077cc;")
 
-        # --- Scroll area for record cards ---
-        self.scrollArea = QtWidgets.QScrollArea()
-        self.scrollArea.setWidgetResizable(True)
-        self.scrollArea.setStyleSheet("border: none; background-color: transparent;")
-
-        self.recordsContainer = QtWidgets.QWidget()
-        self.vboxRecords = QtWidgets.QVBoxLayout(self.recordsContainer)
-        self.vboxRecords.setAlignment(QtCore.Qt.AlignTop)
-        self.vboxRecords.setSpacing(8)
-        self.scrollArea.setWidget(self.recordsContainer)
+        # --- Background sync status ---
+        self.lblSyncStatus = QtWidgets.QLabel("")
+        self.lblSyncStatus.setAlignment(QtCore.Qt.AlignCenter)
+        self.lblSyncStatus.setStyleSheet("font-size:13px; color:#666;")
+
+        # --- Record list: only visible cards are painted, pages load on scroll ---
+        self.model = RecordListModel(user_id, parent=self)
+        self.listRecords = QtWidgets.QListView()
+        self.listRecords.setModel(self.model)
+        self.listRecords.setItemDelegate(RecordCardDelegate(self.listRecords))
+        self.listRecords.setUniformItemSizes(True)
+        self.listRecords.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.listRecords.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.listRecords.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.listRecords.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        self.listRecords.setStyleSheet("border: none; background-color: transparent;")
+
+        self.lblNoData = QtWidgets.QLabel("No biomass records available.")
+        self.lblNoData.setAlignment(QtCore.Qt.AlignCenter)
+        self.lblNoData.setStyleSheet("font-size:16px; margin-top:120px; color:#888;")
+        for signal in (self.model.rowsInserted, self.model.rowsRemoved, self.model.modelReset):
+            signal.connect(self.update_empty_state)
 
         # --- Buttons ---
         self.btnSync = self.make_button("Sync to Cloud", BTN_SYNC)
@@ -61,7 +254,9 @@ class HistoryWindow(QtWidgets.QWidget):
         mainLayout.setContentsMargins(16, 12, 16, 12)
         mainLayout.setSpacing(8)
         mainLayout.addWidget(self.lblTitle)
-        mainLayout.addWidget(self.scrollArea)
+        mainLayout.addWidget(self.lblSyncStatus)
+        mainLayout.addWidget(self.listRecords)
+        mainLayout.addWidget(self.lblNoData)
         mainLayout.addLayout(btnLayout)
 
         # --- Connect buttons ---
@@ -69,7 +264,14 @@ class HistoryWindow(QtWidgets.QWidget):
         self.btnDelete.clicked.connect(self.delete_selected)
         self.btnBack.clicked.connect(self.go_back)
 
+        # --- Sync engine (runs on its own thread; these slots run queued here) ---
+        self.sync.records_synced.connect(self.on_records_synced)
+        self.sync.progress.connect(self.update_sync_status)
+        self.sync.error_changed.connect(self.update_sync_status)
+        self.sync.state_changed.connect(self.update_sync_status)
+
         self.load_records()
+        self.update_sync_status()
 
     def make_button(self, text, color):
         b = QtWidgets.QPushButton(text)
@@ -92,104 +294,49 @@ class HistoryWindow(QtWidgets.QWidget):
 
     # ---------------- DATA HANDLING ----------------
     def load_records(self):
-        """Load all records into styled cards."""
-        # Clear old widgets
-        for i in reversed(range(self.vboxRecords.count())):
-            widget = self.vboxRecords.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-
-        records = get_all_records(self.user_id)
-        if not records:
-            noData = QtWidgets.QLabel("No biomass records available.")
-            noData.setAlignment(QtCore.Qt.AlignCenter)
-            noData.setStyleSheet("font-size:16px; margin-top:120px; color:#888;")
-            self.vboxRecords.addWidget(noData)
-            return
-
-        # Add newest first
-        for rec in reversed(records):
-            recordCard = self.create_record_card(rec)
-            self.vboxRecords.addWidget(recordCard)
-
-    def create_record_card(self, rec):
-        """Create a single styled card for one record."""
-        card = QtWidgets.QFrame()
-        card.setObjectName(str(rec[0]))  # local ID reference
-        card.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
-
-        synced = rec[7]
-        shrimpCount, biomass, feed, date = rec[3], rec[4], rec[5], rec[6]
-        try:
-            date_str = datetime.datetime.fromisoformat(date).strftime("%b %d, %Y • %I:%M %p")
-        except Exception:
-            date_str = str(date)
-
-        # Card colors
-        border_color = "#4CAF50" if synced else "#ff9800"
-        bg_color = "#e8f5e9" if synced else "#fff5e6"
-
-        card.setStyleSheet(f"""
-            QFrame {{
-                background-color: {bg_color};
-                border: 2px solid {border_color};
-                border-radius: 10px;
-                padding: 10px;
-                margin-bottom: 8px;
-            }}
-            QFrame:hover {{
-                background-color: #f1faff;
-            }}
-        """)
+        """Load the first page; the view pulls further pages while scrolling."""
+        if self.model.canFetchMore():
+            self.model.fetchMore()
+        self.update_empty_state()
 
-        layout = QtWidgets.QVBoxLayout(card)
-        layout.setSpacing(4)
-        layout.setContentsMargins(10, 8, 10, 8)
+    def update_empty_state(self, *args):
+        empty = self.model.rowCount() == 0
+        self.listRecords.setVisible(not empty)
+        self.lblNoData.setVisible(empty)
 
-        title = QtWidgets.QLabel(f"Process on {date_str}")
-        title.setStyleSheet("font-size:16px; font-weight:bold; color:#0077cc;")
-
-        lblCount = QtWidgets.QLabel(f"Shrimp Count: {shrimpCount}")
-        lblBiomass = QtWidgets.QLabel(f"Biomass: {biomass:.3f} g")
-        lblFeed = QtWidgets.QLabel(f"Feed: {feed:.3f} g")
-        lblSync = QtWidgets.QLabel(f"Status: {'✅ Synced' if synced else '❌ Not Synced'}")
-
-        for lbl in [lblCount, lblBiomass, lblFeed, lblSync]:
-            lbl.setStyleSheet("font-size:14px; margin-top:2px;")
-
-        layout.addWidget(title)
-        layout.addWidget(lblCount)
-        layout.addWidget(lblBiomass)
-        layout.addWidget(lblFeed)
-        layout.addWidget(lblSync)
-
-        # Card click event
-        card.mousePressEvent = lambda event, rid=rec[0], c=card: self.select_record(rid, c)
-        return card
-
-    # ---------------- SELECTION LOGIC ----------------
-    def select_record(self, record_id, card_widget):
-        """Highlight the selected record visually."""
-        if self.selectedCard:
-            self.selectedCard.setGraphicsEffect(None)
-
-        shadow = QtWidgets.QGraphicsDropShadowEffect()
-        shadow.setBlurRadius(20)
-        shadow.setColor(QtGui.QColor("#0078D7"))
-        shadow.setOffset(0, 0)
-        card_widget.setGraphicsEffect(shadow)
-
-        self.selectedRecordId = record_id
-        self.selectedCard = card_widget
+    def selected_record_id(self):
+        indexes = self.listRecords.selectionModel().selectedIndexes()
+        return self.model.record_id(indexes[0]) if indexes else None
 
     # ---------------- ACTIONS ----------------
     def sync_data(self):
-        synced_count = sync_biomass_records(self.user_id)
-        QtWidgets.QMessageBox.information(self, "Sync Complete", f"{synced_count} record(s) synced to MongoDB Atlas.")
-        self.load_records()
+        """Ask the background engine to sync now; rows turn green as batches land."""
+        self.sync.wake()
+        self.lblSyncStatus.setText("Syncing…")
+
+    def on_records_synced(self, record_ids):
+        self.model.fetch_newer()
+        self.model.refresh_rows(record_ids)
+
+    def update_sync_status(self, *args):
+        sync = self.sync
+        if sync.state == "retrying":
+            text = f"Offline — {sync.pending} record(s) waiting, retrying automatically"
+            if sync.last_error:
+                text += f" ({sync.last_error.splitlines()[0][:80]})"
+        elif sync.state == "syncing":
+            text = f"Syncing… {sync.pending} record(s) left"
+        elif sync.pending:
+            text = f"{sync.pending} record(s) waiting to sync"
+        elif sync.last_sync_time is not None:
+            text = "All records synced · last sync " + time.strftime("%H:%M:%S", time.localtime(sync.last_sync_time))
+        else:
+            text = "All records synced"
+        self.lblSyncStatus.setText(text)
 
     def delete_selected(self):
-        if not self.selectedRecordId:
+        record_id = self.selected_record_id()
+        if record_id is None:
             QtWidgets.QMessageBox.warning(self, "Delete Record", "Please select a record to delete first.")
             return
 
@@ -198,10 +345,8 @@ class HistoryWindow(QtWidgets.QWidget):
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
         )
         if confirm == QtWidgets.QMessageBox.Yes:
-            delete_record(self.selectedRecordId, self.user_id)
-            self.selectedRecordId = None
-            self.selectedCard = None
-            self.load_records()
+            delete_record(record_id, self.user_id)
+            self.model.remove_record(record_id)
 
     def go_back(self):
         if self.parent:
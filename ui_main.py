@@ -10,6 +10,7 @@ from PyQt5 import QtWidgets, QtCore
 from ui_biomass import BiomassWindow
 from ui_history import HistoryWindow
 from database import get_last_record
+from sync_engine import SyncEngine
 from theme import *
 
 # --- Optional: set the platform plugin explicitly (Wayland or EGLFS) ---
@@ -21,6 +22,10 @@ class MainMenu(QtWidgets.QWidget):
         self.user_id = user_id
         self.logout_requested = False
 
+        # Pushes unsynced records to MongoDB in the background for the whole session
+        self.sync = SyncEngine(user_id, parent=self)
+        self.sync.start()
+
         # Make it fixed to target screen size
         self.setWindowFlag(QtCore.Qt.FramelessWindowHint)
         self.setFixedSize(1024, 600)
@@ -138,7 +143,7 @@ class MainMenu(QtWidgets.QWidget):
         self.hide()
 
     def open_history(self):
-        self.hw = HistoryWindow(self, self.user_id)
+        self.hw = HistoryWindow(self, self.user_id, self.sync)
         self.hw.show()
         self.hide()
 
@@ -146,6 +151,10 @@ class MainMenu(QtWidgets.QWidget):
         self.logout_requested = True
         self.close()
 
+    def closeEvent(self, event):
+        self.sync.stop()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)